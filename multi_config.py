@@ -1,85 +1,169 @@
 # type: ignore
 
 import os
-import textwrap
+import sys
+import time
 import argparse
-
-from src_scripts.cfg_manager import CfgManager
-from src_scripts.wkr_manager import PipelineWorker
-
-# Parse arguments.
-
-parser = argparse.ArgumentParser(
-    formatter_class=argparse.RawDescriptionHelpFormatter,
-    usage=argparse.SUPPRESS,
-    description=textwrap.dedent(
-        """
-    ################################################
-    GHRSS Survey FFA Pipeline: Multiple Nodes Script
-    ################################################
-    
-    Launches the GHRSS Survey FFA Pipeline on mutliple
-    machines. All dates are processed in parallel.
-    
-    usage: python %(prog)s [node] [date] -config [config_file] [backend]"""
-    ),
-)
-
-parser.add_argument(
-    "node",
-    type=str,
-    help=textwrap.dedent("""The node on which the data is going to be processed."""),
-)
-
-parser.add_argument(
-    "date",
-    type=str,
-    help=textwrap.dedent("""The date to be processed on a particular node."""),
-)
-
-parser.add_argument(
-    "-config",
-    type=str,
-    default="./configurations/ghrss_config.yaml",
-    help=textwrap.dedent("""The absolute path to the "ghrss_config.yaml" file."""),
-)
-
-parser.add_argument(
-    "backend",
-    type=str,
-    help=textwrap.dedent(
-        """The specific backend which produced the data. 
-                    Could be one of:
-                    
-                        1. GMRT Software Backend (GSB), 
-                        2. GMRT Wideband Backend (GWB), or
-                        3. SIMulated GWB data (SIM).
-                    The SIM backend is used only for testing purposes."""
-    ),
-)
-
-try:
+import threading
+
+from src_scripts.cfg_manager import CfgManager, HEARTBEAT_INTERVAL
+from src_scripts.wkr_manager import PipelineWorker, PipelineManager
+
+
+def parse_arguments():
+
+    """ Parse command line arguments with which the script was called. """
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage=argparse.SUPPRESS,
+        description="""
+################################################
+GHRSS Survey FFA Pipeline: Multiple Nodes Script
+################################################
+
+Launches the GHRSS Survey FFA Pipeline on mutliple
+machines. All dates are processed in parallel.
+
+usage: python %(prog)s [node] [dates] -config [config_file] [backend]""",
+    )
+
+    parser.add_argument(
+        "node",
+        type=str,
+        help="""The node on which the data is going to be processed.""",
+    )
+
+    parser.add_argument(
+        "dates",
+        type=str,
+        help="""The date(s) to be processed on a particular node.
+Multiple dates may be given as a comma-separated list.""",
+    )
+
+    parser.add_argument(
+        "-config",
+        type=str,
+        default="./configurations/ghrss_config.yaml",
+        help="""The absolute path to the "ghrss_config.yaml" file.""",
+    )
+
+    parser.add_argument(
+        "--job-run-id",
+        type=str,
+        default=None,
+        help="""An identifier for this job run. Dates are claimed per node and
+job run, so re-running with the same identifier resumes the same dates.
+Defaults to the node name, so that a node restarted after a crash can
+reclaim the dates it already owns.""",
+    )
+
+    parser.add_argument(
+        "backend",
+        type=str,
+        help="""The specific backend which produced the data.
+Could be one of:
+
+    1. GMRT Software Backend (GSB),
+    2. GMRT Wideband Backend (GWB), or
+    3. SIMulated GWB data (SIM).
+The SIM backend is used only for testing purposes.""",
+    )
+
+    # Errors in the arguments are reported (and exit) by "argparse" itself.
 
     args = parser.parse_args()
 
-except:
+    return args
+
+
+def start_heartbeat(cfg, node, interval=HEARTBEAT_INTERVAL):
+
+    """Send a heartbeat for this node right away, and then keep sending them
+    every "interval" seconds from a background thread, for as long as this
+    script is running. A failed heartbeat (for instance, a locked or busy
+    state database) is reported and retried at the next interval, instead
+    of stopping the thread.
+    """
+
+    cfg.heartbeat(node)
+
+    def beat():
+        while True:
+            time.sleep(interval)
+            try:
+                cfg.heartbeat(node)
+            except Exception as err:
+                print(
+                    "Node {}: heartbeat failed ({!r}), retrying in {} s.".format(node, err, interval),
+                    file=sys.stderr,
+                    flush=True,
+                )
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+
+
+def main():
+
+    args = parse_arguments()
+
+    # Convert any relative paths to absolute paths, just in case.
+    # A plain "abspath" is enough here: the configuration file is only
+    # ever opened, which follows symbolic links by itself, so there is
+    # no need to resolve them with "realpath".
+    # Store all arguments.
+
+    node = args.node
+    dates = [date.strip() for date in args.dates.split(",") if date.strip()]
+    config_file = os.path.abspath(args.config)
+    backend = args.backend
+    run_id = args.job_run_id or node
+
+    # Get the pipeline configuration.
+
+    cfg = CfgManager(config_file, backend)
+
+    # Announce this node as alive, and share the cluster-wide
+    # process budget between all live nodes. This node's share
+    # bounds every pool it runs: when several dates are processed
+    # at once, it is further split between them, and each date
+    # sizes all of its own pools (including the FFA search) by
+    # its part of it.
+
+    start_heartbeat(cfg, node)
+    cfg.cores = cfg.effective_cores()
+
+    # Only process the dates that no other node or job run has claimed.
 
-    parser.print_help()
-    parser.exit(1)
+    print("Node {}: job run ID {}.".format(node, run_id), file=sys.stderr, flush=True)
 
-# Convert any relative paths to absolute paths, just in case.
-# Store all arguments.
+    claimed = []
+    for date in dates:
+        if cfg.claim_date(date, node, run_id):
+            claimed.append(date)
+        else:
+            print(
+                "Node {}: skipping {}, already claimed by another node or job run.".format(node, date),
+                file=sys.stderr,
+                flush=True,
+            )
+    dates = claimed
 
-node = args.node
-date = args.date
-config_file = os.path.realpath(args.config)
-backend = args.backend
+    if not dates:
+        print("Node {}: no dates left to process.".format(node), file=sys.stderr, flush=True)
+        return
 
-# Get the pipeline configuration.
+    # Initialise the pipeline. A shard of several dates is processed
+    # in parallel, a single date is processed directly.
 
-cfg = CfgManager(config_file, backend)
+    if len(dates) > 1:
+        manager = PipelineManager(cfg)
+        manager.process(dates)
+    else:
+        worker = PipelineWorker(cfg)
+        worker(dates[0])
 
-# Initialise the pipeline.
 
-worker = PipelineWorker(cfg)
-worker(date)
+if __name__ == "__main__":
+    main()
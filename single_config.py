@@ -1,77 +1,82 @@
 # type: ignore
 
 import os
-import textwrap
 import argparse
 
 from src_scripts.cfg_manager import CfgManager
 from src_scripts.wkr_manager import PipelineManager
 
-# Parse arguments.
-
-parser = argparse.ArgumentParser(
-    formatter_class=argparse.RawDescriptionHelpFormatter,
-    usage=argparse.SUPPRESS,
-    description=textwrap.dedent(
-        """
-    #############################################
-    GHRSS Survey FFA Pipeline: Single Node Script
-    #############################################
-    
-    Launches the GHRSS Survey FFA Pipeline on a 
-    single machine. All dates are processed in
-    parallel.
-    
-    usage: python %(prog)s -config [config_file] [backend]"""
-    ),
-)
-
-parser.add_argument(
-    "-config",
-    type=str,
-    default="./configurations/ghrss_config.yaml",
-    help=textwrap.dedent(
-        """
-                    The path to the "ghrss_config.yaml" file."""
-    ),
-)
-
-parser.add_argument(
-    "backend",
-    type=str,
-    help=textwrap.dedent(
-        """
-                    The specific backend which produced the data. 
-                    Could be one of:
-
-                    1. GMRT Software Backend (GSB), 
-                    2. GMRT Wideband Backend (GWB), or
-                    3. SIMulated GWB data (SIM).
-
-                    The SIM backend is used only for testing purposes."""
-    ),
-)
-
-try:
+
+def parse_arguments():
+
+    """ Parse command line arguments with which the script was called. """
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage=argparse.SUPPRESS,
+        description="""
+#############################################
+GHRSS Survey FFA Pipeline: Single Node Script
+#############################################
+
+Launches the GHRSS Survey FFA Pipeline on a
+single machine. All dates are processed in
+parallel.
+
+usage: python %(prog)s -config [config_file] [backend]""",
+    )
+
+    parser.add_argument(
+        "-config",
+        type=str,
+        default="./configurations/ghrss_config.yaml",
+        help="""
+The path to the "ghrss_config.yaml" file.""",
+    )
+
+    parser.add_argument(
+        "backend",
+        type=str,
+        help="""
+The specific backend which produced the data.
+Could be one of:
+
+1. GMRT Software Backend (GSB),
+2. GMRT Wideband Backend (GWB), or
+3. SIMulated GWB data (SIM).
+
+The SIM backend is used only for testing purposes.""",
+    )
+
+    # Errors in the arguments are reported (and exit) by "argparse" itself.
 
     args = parser.parse_args()
 
-except:
+    return args
+
+
+def main():
+
+    args = parse_arguments()
+
+    # Convert any relative paths to absolute paths, just in case.
+    # A plain "abspath" is enough here: the configuration file is only
+    # ever opened, which follows symbolic links by itself, so there is
+    # no need to resolve them with "realpath".
+    # Store all arguments.
 
-    parser.print_help()
-    parser.exit(1)
+    config_file = os.path.abspath(args.config)
+    backend = args.backend
 
-# Convert any relative paths to absolute paths, just in case.
-# Store all arguments.
+    # Get the pipeline configuration.
 
-config_file = os.path.realpath(args.config)
-backend = args.backend
+    cfg = CfgManager(config_file, backend)
 
-# Get the pipeline configuration.
+    # Initialise the pipeline.
 
-cfg = CfgManager(config_file, backend)
+    manager = PipelineManager(cfg)
+    manager.process()
 
-# Initialise the pipeline.
 
-manager = PipelineManager(cfg)
-manager.process()
+if __name__ == "__main__":
+    main()
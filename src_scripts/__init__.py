@@ -1,20 +1,42 @@
 # type: ignore
 
-from .metas import Meta
+import importlib
+
 from .cfg_manager import CfgManager
-from .filterbank_no_rfifind import Filterbank
-from .wkr_manager import PipelineWorker, PipelineManager
-
-from .utilities import (
-    unpickler,
-    reader,
-    grouper,
-    filter_by_ext,
-    count_files,
-    list_files,
-    step_iter,
-    make_pdf,
-)
+
+# Everything else is imported lazily, on first access, since it pulls in
+# heavy dependencies (NumPy, PIL, astropy, riptide, ...) that most entry
+# points never need.
+
+_LAZY_ = {
+    "Meta": ".metas",
+    "Filterbank": ".filterbank_no_rfifind",
+    "PipelineWorker": ".wkr_manager",
+    "PipelineManager": ".wkr_manager",
+    "unpickler": ".utilities",
+    "reader": ".utilities",
+    "grouper": ".utilities",
+    "filter_by_ext": ".utilities",
+    "count_files": ".utilities",
+    "list_files": ".utilities",
+    "step_iter": ".utilities",
+    "make_pdf": ".utilities",
+    "ps_to_pdf": ".utilities",
+    "merge_pdfs": ".utilities",
+}
+
+
+def __getattr__(name):
+    try:
+        module = _LAZY_[name]
+    except KeyError:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name)
+        ) from None
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
 
 __all__ = [
     "CfgManager",
@@ -28,4 +50,6 @@ __all__ = [
     "list_files",
     "step_iter",
     "make_pdf",
+    "ps_to_pdf",
+    "merge_pdfs",
 ]
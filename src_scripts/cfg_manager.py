@@ -3,12 +3,172 @@
 ### Standard imports ###
 
 import os
+import re
+import sys
+import enum
+import time
 import pprint
+import sqlite3
+import functools
+import contextlib
+import dataclasses
 
 ### Non-standard imports ###
 
 import yaml
 
+# Use the libyaml-backed loader if PyYAML was built with it.
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# Interval between heartbeats sent by each live node, in seconds.
+
+HEARTBEAT_INTERVAL = 60.0
+
+# Splits comma-separated lists, discarding any surrounding whitespace.
+
+_CSV_RE = re.compile(r"\s*,\s*")
+
+# The expected layout of the configuration file. Leaves are the type(s) a
+# value must have. Keys whose types include NoneType may be left blank or
+# omitted altogether. The per-backend sections are checked separately,
+# once the backend is known.
+
+_NUMBER_ = (int, float)
+
+_CONFIG_SCHEMA_ = {
+    "pipeline_variables": {
+        "cores": int,
+        "nodes": object,
+        "dates": dict,
+        "max_dates": (int, type(None)),
+        "global_io_budget": (int, type(None)),
+    },
+    "path_variables": {
+        "store_path": str,
+        "pipeline_path": str,
+    },
+    "RFI Masking": {
+        "Bad channels": dict,
+        "FREQ SIGMA": _NUMBER_,
+    },
+    "DDPlan": dict,
+    "Folding": {
+        "PD": _NUMBER_,
+        "PDD": _NUMBER_,
+        "NUMBINS": int,
+        "NSUBCHAN": int,
+        "NPART": int,
+    },
+}
+
+_DDPLAN_SCHEMA_ = {
+    "DM_highest": _NUMBER_,
+    "DM_lowest": _NUMBER_,
+    "nsub": int,
+    "dDM": _NUMBER_,
+    "DS": int,
+    "numDMs": int,
+}
+
+
+# The sections of the configuration file that hold one entry per backend.
+
+_BACKEND_SECTIONS_ = {
+    "dates": "pipeline_variables/dates",
+    "bad_channels": "RFI Masking/Bad channels",
+    "ddplan": "DDPlan",
+}
+
+
+def _validate(config, schema, where=""):
+
+    """Check that a parsed configuration matches the given schema, raising
+    a ValueError naming the offending key if it does not.
+
+    Parameters:
+    -----------
+    config: dict
+        The (section of the) parsed configuration.
+    schema: dict
+        The schema to check against.
+    where: str
+        The path to this section in the configuration, used in error messages.
+    """
+
+    if not isinstance(config, dict):
+        msg = "Config section '{w:s}' must be a mapping instead of '{ti:s}'".format(
+            w=where or "<root>", ti=type(config).__name__
+        )
+        raise ValueError(msg)
+
+    for key, expected in schema.items():
+        name = "/".join([where, key]) if where else key
+        val = config.get(key, None)
+        if isinstance(expected, dict):
+            _validate(val, expected, name)
+        elif val is None and not (
+            isinstance(expected, tuple) and type(None) in expected
+        ):
+            raise ValueError("Config key '{k:s}' is missing".format(k=name))
+        elif not isinstance(val, expected):
+            types = expected if isinstance(expected, tuple) else (expected,)
+            msg = "Config key '{k:s}' must have type '{t:s}' instead of '{ti:s}'".format(
+                k=name,
+                t=" or ".join(t.__name__ for t in types),
+                ti=type(val).__name__,
+            )
+            raise ValueError(msg)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_cfg(path, mtime):
+
+    """Parse and validate a YAML configuration file, memoized by its path and
+    modification time. The returned dictionary is shared between callers, and is therefore
+    not to be mutated.
+
+    Parameters:
+    -----------
+    path: str
+        The absolute path to the configuration file.
+    mtime: float
+        The modification time of the configuration file. Only used
+        as part of the cache key, so that edits invalidate the cache.
+    """
+
+    with open(path, "r") as fobj:
+        config = yaml.load(fobj, Loader=SafeLoader)
+    _validate(config, _CONFIG_SCHEMA_)
+    return config
+
+
+class Backend(enum.IntEnum):
+
+    """ The backends that may have produced the data. """
+
+    GSB = 0
+    GWB = 1
+    SIM = 2
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Paths(object):
+
+    """ Immutable record of all path variables of the pipeline. """
+
+    store_path: str
+    pipeline_path: str
+    configurations_path: str
+    scripts_path: str
+    preprocessing_path: str
+    sources_path: str
+    rfi_path: str
+    state_path: str
+
 
 class CfgManager(object):
 
@@ -36,24 +196,23 @@ class CfgManager(object):
             The SIM backend is used only for testing purposes.
         """
 
-        self.backend = backend
+        self.backend = backend.upper()
         self._config = self.parse_yaml_config(config_file)
+        self.validate_backend()
 
     ### Pipeline variables. ###
 
-    @property
+    @functools.cached_property
     def cores(self):
         """ Number of cores per node. """
         return self._config["pipeline_variables"]["cores"]
 
-    @property
+    @functools.cached_property
     def nodes(self):
         """ List of node ID(s). """
-        nodes = self._config["pipeline_variables"]["nodes"]
-        nodes = [d.strip() for d in nodes.split(",")]
-        return nodes
+        return self._split_csv(self._config["pipeline_variables"]["nodes"])
 
-    @property
+    @functools.cached_property
     def mach_config(self):
         """The machine configuration ("single" or "multiple").
         Decided by looking at the list of node ID(s) entered by
@@ -66,15 +225,18 @@ class CfgManager(object):
 
         return mach_config
 
-    @property
+    @functools.cached_property
     def analysis_dates(self):
-        """ The dates to be analysed. Filtered by backend. """
-        dates = str(self._config["pipeline_variables"]["dates"][self.backend])
-        dates = [d.strip() for d in dates.split(",")]
-        dates = dates[:5]
+        """The dates to be analysed. Filtered by backend, and capped
+        at "max_dates" dates if that is set in the configuration file.
+        """
+        dates = self._split_csv(self._backend_tables["dates"][self._backend_index])
+        limit = self._config["pipeline_variables"].get("max_dates")
+        if limit:
+            dates = dates[:limit]
         return dates
 
-    @property
+    @functools.cached_property
     def variables(self):
         """ All pipeline variables compiled into a dictionary. """
         VarDict = {
@@ -89,70 +251,77 @@ class CfgManager(object):
 
     ### Path variables. ###
 
+    @functools.cached_property
+    def paths(self):
+        """ All path variables, computed once and stored in a "Paths" object. """
+        # Only drop a single trailing separator, and never reduce
+        # the root directory ("/") to an empty string.
+
+        store_path = self._config["path_variables"]["store_path"]
+        store_path = store_path.removesuffix(os.sep) or os.sep
+        pipeline_path = self._config["path_variables"]["pipeline_path"]
+        pipeline_path = pipeline_path.removesuffix(os.sep) or os.sep
+        data_path = os.path.dirname(store_path)
+
+        return Paths(
+            store_path=store_path,
+            pipeline_path=pipeline_path,
+            configurations_path=os.path.join(pipeline_path, "configurations"),
+            scripts_path=os.path.join(pipeline_path, "src_scripts"),
+            preprocessing_path=os.path.join(pipeline_path, "preprocessing"),
+            sources_path=os.path.join(pipeline_path, "sources"),
+            rfi_path=os.path.join(data_path, "RFI"),
+            state_path=os.path.join(data_path, "state"),
+        )
+
     @property
     def store_path(self):
         """ The absolute path where all inputs are stored. """
-        return self._config["path_variables"]["store_path"].rstrip(os.path.sep)
+        return self.paths.store_path
 
     @property
     def pipeline_path(self):
         """ The absolute path where the pipeline itself resides. """
-        return self._config["path_variables"]["pipeline_path"].rstrip(os.path.sep)
+        return self.paths.pipeline_path
 
     @property
     def configurations_path(self):
         """ The absolute path where all configuration files reside. """
-        return os.path.join(self.pipeline_path, "configurations")
+        return self.paths.configurations_path
 
     @property
     def scripts_path(self):
         """ The absolute path where all pipeline scripts are stored. """
-        return os.path.join(self.pipeline_path, "src_scripts")
+        return self.paths.scripts_path
 
     @property
     def preprocessing_path(self):
         """ The absolute path where all preprocessing templates are stored. """
-        return os.path.join(self.pipeline_path, "preprocessing")
+        return self.paths.preprocessing_path
 
     @property
     def sources_path(self):
         """ The absolute path where all source list for the GHRSS survey reside. """
-        return os.path.join(self.pipeline_path, "sources")
+        return self.paths.sources_path
 
     @property
     def rfi_path(self):
         """ The absolute path where all RFI masks are stored. """
-        return os.path.join(os.path.dirname(self.store_path), "RFI")
+        return self.paths.rfi_path
 
     @property
     def state_path(self):
         """ The absolute path where all output files are stored. """
-        return os.path.join(os.path.dirname(self.store_path), "state")
-
-    @property
-    def paths(self):
-        """ All path variables compiled into a dictionary. """
-        PathDict = {
-            "store_path": self.store_path,
-            "pipeline_path": self.pipeline_path,
-            "configurations_path": self.configurations_path,
-            "scripts_path": self.scripts_path,
-            "preprocessing_path": self.preprocessing_path,
-            "sources_path": self.sources_path,
-            "rfi_path": self.rfi_path,
-            "state_path": self.state_path,
-        }
-
-        return PathDict
+        return self.paths.state_path
 
     ### Processing variables. ###
 
-    @property
+    @functools.cached_property
     def bad_channels(self):
         """ The bad frequency channels, filtered by backend. """
-        return self._config["RFI Masking"]["Bad channels"][self.backend]
+        return self._backend_tables["bad_channels"][self._backend_index]
 
-    @property
+    @functools.cached_property
     def freq_sig(self):
         """Sigma-cutoff for frequency flagging, carried out by
         the "rfifind" module. Cut-off used only for the GWB/SIM
@@ -160,24 +329,82 @@ class CfgManager(object):
         """
         return self._config["RFI Masking"]["FREQ SIGMA"]
 
-    @property
+    @functools.cached_property
     def ddplan(self):
         """ The de-dispersion plan. """
-        return self._config["DDPlan"][self.backend]
+        return self._backend_tables["ddplan"][self._backend_index]
 
-    @property
+    @functools.cached_property
     def folding_params(self):
         """Parameters used by the "prepfold" module for folding
         all output pulsar candidates thrown out by the FFA module.
         """
         return self._config["Folding"]
 
+    ### Per-backend tables. ###
+
+    @functools.cached_property
+    def _backend_index(self):
+        """ Index of the current backend in the per-backend tables. """
+        return Backend[self.backend]
+
+    @functools.cached_property
+    def _backend_tables(self):
+        """The per-backend sections of the configuration, each stored
+        as a tuple indexed by "Backend".
+        """
+        tables = {}
+        for name, where in _BACKEND_SECTIONS_.items():
+            section = self._config
+            for key in where.split("/"):
+                section = section[key]
+            tables[name] = tuple(section.get(b.name, None) for b in Backend)
+        return tables
+
+    def validate_backend(self):
+
+        """Check that the configuration file has all sections specific to the
+        current backend, so that a missing one is reported right away instead
+        of midway through processing.
+        """
+
+        if self.backend not in Backend.__members__:
+            msg = "Unknown backend '{b:s}', must be one of: {bs:s}".format(
+                b=self.backend, bs=", ".join(Backend.__members__)
+            )
+            raise ValueError(msg)
+
+        for name, table in self._backend_tables.items():
+            if table[self._backend_index] is None:
+                msg = "Config key '{k:s}/{b:s}' is missing".format(
+                    k=_BACKEND_SECTIONS_[name], b=self.backend
+                )
+                raise ValueError(msg)
+
+        _validate(self.ddplan, _DDPLAN_SCHEMA_, "DDPlan/{}".format(self.backend))
+
+    @staticmethod
+    def _split_csv(raw):
+
+        """Split a comma-separated list from the configuration file. YAML may
+        parse single entries (such as a lone date) into non-string types, in
+        which case they are converted back into strings first.
+        """
+
+        if not raw:
+            return []
+        if not isinstance(raw, str):
+            raw = str(raw)
+        return _CSV_RE.split(raw.strip())
+
     def parse_yaml_config(self, fname):
 
         """Parse the YAML configuration file.
 
-        Uses the "safe_load" method since the "load" method is known
-        to be a unsafe (since it can load "any" Python object).
+        Uses the "SafeLoader" (the C version, if available) since the
+        default loader is known to be a unsafe (since it can load "any"
+        Python object). Parsed configurations are cached by path and
+        modification time.
 
         Parameters:
         -----------
@@ -185,9 +412,115 @@ class CfgManager(object):
             The absolute path to the configuration file.
         """
 
-        with open(fname, "r") as fobj:
-            config = yaml.safe_load(fobj)
-        return config
+        fname = os.fspath(fname)
+        return _load_cfg(fname, os.path.getmtime(fname))
+
+    def _connect_state_db(self, fname):
+
+        """Open a SQLite database in the state directory, shared by all nodes.
+        The connection is in autocommit mode, so transactions must be started
+        explicitly, and it is closed on leaving the returned context manager.
+
+        Parameters:
+        -----------
+        fname: str
+            The name of the database file.
+        """
+
+        os.makedirs(self.state_path, exist_ok=True)
+        db_path = os.path.join(self.state_path, fname)
+        conn = sqlite3.connect(db_path, timeout=60.0, isolation_level=None)
+        return contextlib.closing(conn)
+
+    def claim_date(self, date, node, run_id):
+
+        """Atomically claim a date for processing on a particular node. Claims
+        are recorded in a SQLite database in the state directory, shared by
+        all nodes. Returns True if the date now belongs to this node and job
+        run, either because it was just claimed or because the same job run
+        claimed it before (making retries idempotent), and False if another
+        node or job run got to it first.
+
+        Parameters:
+        -----------
+        date: str
+            The date to be claimed.
+        node: str
+            The node ID claiming the date.
+        run_id: str
+            An identifier for the job run claiming the date.
+        """
+
+        with self._connect_state_db("claims.sqlite") as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS claims "
+                "(date TEXT PRIMARY KEY, node TEXT, run_id TEXT, ts REAL)"
+            )
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR IGNORE INTO claims (date, node, run_id, ts) "
+                    "VALUES (?, ?, ?, ?)",
+                    (date, node, run_id, time.time()),
+                )
+                owner = conn.execute(
+                    "SELECT node, run_id FROM claims WHERE date = ?", (date,)
+                ).fetchone()
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        return owner == (node, run_id)
+
+    def heartbeat(self, node):
+
+        """Record that a node is alive, in a SQLite database in the state
+        directory. Used to work out the number of active nodes.
+
+        Parameters:
+        -----------
+        node: str
+            The node ID sending the heartbeat.
+        """
+
+        with self._connect_state_db("heartbeats.sqlite") as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS heartbeats (node TEXT PRIMARY KEY, ts REAL)"
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO heartbeats (node, ts) VALUES (?, ?)",
+                (node, time.time()),
+            )
+
+    def effective_cores(self, interval=HEARTBEAT_INTERVAL):
+
+        """The number of cores each node should use, given the number of nodes
+        currently alive. The "global_io_budget" in the configuration file caps
+        the total number of processes across all nodes, and is shared equally
+        between all nodes that have sent a heartbeat in the last two intervals.
+        If no budget is set, this is simply the number of cores per node.
+
+        Parameters:
+        -----------
+        interval: float
+            The interval between heartbeats, in seconds.
+        """
+
+        budget = self._config["pipeline_variables"].get("global_io_budget")
+        if not budget:
+            return self.cores
+
+        with self._connect_state_db("heartbeats.sqlite") as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS heartbeats (node TEXT PRIMARY KEY, ts REAL)"
+            )
+            (active,) = conn.execute(
+                "SELECT COUNT(*) FROM heartbeats WHERE ts > ?",
+                (time.time() - 2 * interval,),
+            ).fetchone()
+
+        return max(1, min(self.cores, budget // max(1, active)))
 
     def print_config(self):
 
@@ -195,21 +528,24 @@ class CfgManager(object):
         just in case it needs to be verified by the user.
         """
 
-        print("\nVariables\n")
-        for key, value in self.variables.items():
-            print("{}: {}".format(key, value))
+        lines = ["\nVariables\n\n"]
+        lines.extend("{}: {}\n".format(k, v) for k, v in self.variables.items())
+
+        lines.append("\nPaths\n\n")
+        lines.extend(
+            "{}: {}\n".format(k, v) for k, v in dataclasses.asdict(self.paths).items()
+        )
+
+        lines.append("\nBad Channels\n\n")
+        lines.append("{}\n".format(self.bad_channels))
 
-        print("\nPaths\n")
-        for key, value in self.paths.items():
-            print("{}: {}".format(key, value))
+        lines.append("\nDD Plan\n\n")
+        lines.extend("{}: {}\n".format(k, v) for k, v in self.ddplan.items())
 
-        print("\nBad Channels\n")
-        print(self.bad_channels)
+        lines.append("\nFolding Parameters\n\n")
+        lines.extend("{}: {}\n".format(k, v) for k, v in self.folding_params.items())
 
-        print("\nDD Plan\n")
-        for key, value in self.ddplan.items():
-            print("{}: {}".format(key, value))
+        # Write everything in one go, so that the output is not interleaved
+        # with that of other processes.
 
-        print("\nFolding Parameters\n")
-        for key, value in self.folding_params.items():
-            print("{}: {}".format(key, value))
+        sys.stdout.write("".join(lines))
@@ -3,23 +3,35 @@
 ### Standard imports ###
 
 import os
-import re
+import glob
 import shlex
+import shutil
 import timeit
 import logging
+import functools
 import subprocess
 
 from datetime import datetime
 from datetime import timedelta
 from concurrent.futures import wait
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
 from concurrent.futures import ProcessPoolExecutor as Pool
 
 ### Non-standard imports ###
 
-import fileinput
 import numpy as np
 import matplotlib
 
+# Select the non-interactive backend before "pyplot" is imported anywhere,
+# including by "riptide", and disable the "too many figures open" warning.
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+
+plt.rcParams["figure.max_open_warning"] = 0
+
 from pytz import timezone
 from datetime import datetime
 from astropy.time import Time
@@ -30,10 +42,79 @@ from riptide.pipelines import CandidatePlot
 
 ### Local imports ###
 
-from .utilities import grouper, filter_by_ext, count_files, step_iter, make_pdf
+from .utilities import (
+    filter_by_ext,
+    count_files,
+    make_pdf,
+    ps_to_pdf,
+    merge_pdfs,
+)
 from .metas import Meta
 
 
+@functools.lru_cache(maxsize=1)
+def load_source_catalog(sources_path):
+
+    """Read all source lists of the GHRSS survey into a dictionary that maps
+    each source ID to its coordinates (as a pair of RA and DEC strings). The
+    catalog is read once per process and cached.
+
+    Parameters:
+    -----------
+    sources_path: str or Path-like
+        The absolute path to the directory with the source lists.
+    """
+
+    catalog = {}
+
+    for source_list in filter_by_ext(sources_path, extension=".list"):
+        with open(source_list.path, "r") as instream:
+            for source in instream:
+                fields = source.split()
+                if len(fields) < 3:
+                    continue
+                ID, raj, decj = fields[:3]
+                # Keep the position of the last entry for each ID.
+                catalog.pop(ID, None)
+                catalog[ID] = (raj, decj)
+
+    return catalog
+
+
+def render_candidate(job):
+
+    """Plot a single candidate and save the plot as a PNG image. Defined at the
+    top level of the module so that it can be mapped over by a process pool.
+
+    Parameters:
+    -----------
+    job: tuple
+        The absolute paths to the candidate ("*.h5") file
+        and to the image file to be saved.
+    """
+
+    cand_path, img_path = job
+    cand_plot_obj = CandidatePlot(Candidate.load_hdf5(cand_path))
+    cand_plot_obj.saveimg(img_path)
+
+
+def archive_profile(arg_arv):
+
+    """Archive a single folded profile using the "pam" command from "PSRCHIVE".
+    Raises a "CalledProcessError", carrying the error output of "pam", if the
+    profile could not be archived.
+
+    Parameters:
+    -----------
+    arg_arv: list
+        The "pam" command, split into its arguments.
+    """
+
+    subprocess.run(
+        arg_arv, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True
+    )
+
+
 class Filterbank(object):
 
     """ Container for a filterbank file. """
@@ -78,6 +159,11 @@ class Filterbank(object):
 
         self.output_name = os.path.splitext(self.name)[0]
 
+        # Absolute path to the input file, without its extension. All intermediate
+        # files made from a "*.raw" file are named after it.
+
+        self.stem_path = os.path.splitext(self.path)[0]
+
         self.output_rfi_path = os.path.join(beam_rfi_path, self.output_name)
         self.timeseries_path = os.path.join(beam_state_path, self.output_name)
 
@@ -85,6 +171,17 @@ class Filterbank(object):
         self.fold_prf_path = os.path.join(self.timeseries_path, "folded_profiles")
         self.arv_prf_path = os.path.join(self.timeseries_path, "archived_profiles")
 
+        # Folding parameters, looked up once rather than once per candidate.
+
+        folding_params = self.config.folding_params
+        self.fold_params = (
+            folding_params["PD"],
+            folding_params["PDD"],
+            folding_params["NUMBINS"],
+            folding_params["NPART"],
+        )
+        self.fold_nsub = folding_params["NSUBCHAN"]
+
         # Configure the logger.
 
         self.configure_logger()
@@ -93,26 +190,36 @@ class Filterbank(object):
 
         self._attrs_ = {"fname": self.name}
 
-    @property
+    @functools.cached_property
     def proc_dm_trials(self):
         """ Number of "processed" DM trials. """
         return count_files(self.timeseries_path, extension=".inf")
 
-    @property
+    @functools.cached_property
     def num_candidates(self):
         """ Number of output candidates generated. """
         return count_files(self.cands_path, extension=".h5")
 
-    @property
+    @functools.cached_property
     def num_fold_prfs(self):
         """ Number of folded profiles generated. """
         return count_files(self.fold_prf_path, extension=".pfd")
 
-    @property
+    @functools.cached_property
     def num_arv_prfs(self):
         """ Number of folded profiles archived """
         return count_files(self.arv_prf_path, extension=".archive")
 
+    def recount(self, *names):
+
+        """Discard the cached values of the given file counts (such as
+        "num_candidates"), so that they are counted afresh on next access.
+        Called whenever a processing step adds files to be counted.
+        """
+
+        for name in names:
+            self.__dict__.pop(name, None)
+
     def cumulative_walltime(self):
 
         """Returns the total amount of time spent in processing each filterbank
@@ -155,7 +262,7 @@ class Filterbank(object):
 
         self.logger.info("Calculating date/time parameters.")
 
-        TMSTMP_PATH = self.path.replace(".raw", ".raw.timestamp")
+        TMSTMP_PATH = self.stem_path + ".raw.timestamp"
 
         with open(TMSTMP_PATH, "r") as instream:
             line = instream.readline()
@@ -169,29 +276,21 @@ class Filterbank(object):
         sec = param[5]
         tstmp = param[6]
 
-        date = year + "-" + month + "-" + day
-        time = hour + ":" + minute + ":" + sec
-
         IST = timezone("Asia/Kolkata")
-        fmt = "%Y-%m-%d %H:%M:%S"
 
-        ist = IST.localize(datetime.strptime(date + " " + time, fmt))
-        utc = (
-            ist.astimezone(timezone("UTC")).strftime(fmt)
-            + "."
-            + tstmp.replace("0.", "")
-        )
-        utc_date = utc.split(" ")[0]
-        utc_time = utc.split(" ")[1]
-        utc_obj = Time(utc, precision=9)
-
-        self.mjd = int(utc_obj.mjd)
-        self.utc_date = (
-            datetime.strptime(utc_date, "%Y-%m-%d")
-            .strftime("%d/%m/%Y")
-            .replace("-", "/")
+        ist = IST.localize(
+            datetime(
+                int(year), int(month), int(day), int(hour), int(minute), int(sec)
+            )
         )
-        self.utc_time = utc_time
+        utc = ist.astimezone(timezone("UTC"))
+
+        # The fractional part of a second cannot move the date across
+        # midnight, so it is left out of the MJD.
+
+        self.mjd = int(Time(utc, precision=9).mjd)
+        self.utc_date = utc.strftime("%d/%m/%Y")
+        self.utc_time = utc.strftime("%H:%M:%S") + "." + tstmp.replace("0.", "")
 
         self.logger.info("Date/time parameters calculated.")
 
@@ -203,21 +302,22 @@ class Filterbank(object):
 
         self.logger.info("Searching for source in source lists. Getting coordinates.")
 
-        source_lists = [
-            files
-            for files in filter_by_ext(self.config.sources_path, extension=".list")
-        ]
-        sources = fileinput.input(source_lists)
+        catalog = load_source_catalog(self.config.sources_path)
 
-        for source in sources:
+        # If several source IDs match, the last one in the source lists wins.
 
-            ID = source.split()[0]
+        match = None
 
-            if self.output_name.find(ID) != -1:
+        for ID, coords in catalog.items():
+            if ID in self.output_name:
+                match = ID, coords
 
-                self.source_id = ID
-                src_raj = source.split()[1]
-                src_decj = source.split()[2]
+        if match is None:
+            raise ValueError(
+                "No source in the source lists matches {}.".format(self.output_name)
+            )
+
+        self.source_id, (src_raj, src_decj) = match
 
         self.logger.info("Got coordinates.")
 
@@ -252,32 +352,6 @@ class Filterbank(object):
 
         self.logger.info("Coordinates stored.")
 
-    def fill_blank(self, search_str, fill_str, filler):
-
-        """Fill a blank in the header template file. Takes a search string
-        for the field to be filled, a line in the header file, and the filler
-        variable. Fills the blank if the line matches the search string,
-        otherwise returns it without any change.
-
-        Parameters:
-        -----------
-        search_str: str
-            The field to be searched.
-        fill_str: str
-            The line in the file to be filled.
-        filler: int, float or str
-            The filler variable.
-        """
-
-        regex = re.compile(search_str)
-
-        if re.match(regex, fill_str):
-            filled_str = " ".join([fill_str, str(filler)])
-        else:
-            filled_str = fill_str
-
-        return filled_str
-
     def fill_template(self, template_path):
 
         """Fill in the template file for the header and write a header file
@@ -294,12 +368,6 @@ class Filterbank(object):
             template_path, ".".join(["template", self.config.backend, "gmrt_hdr"])
         )
 
-        template = []
-
-        with open(header_template, "r") as instream:
-            for line in instream:
-                template.append(line.strip())
-
         # The blank fields in the template and the variables they are to be filled with.
 
         blanks = ["Date", "MJD", "UTC", "Source", "Coordinates"]
@@ -312,14 +380,22 @@ class Filterbank(object):
             self.coords_str,
         ]
 
-        # Fill the template and write it to file in one go.
+        blanks_fillers = [(blank, str(filler)) for blank, filler in zip(blanks, fillers)]
+
+        # Fill the template and write it to file in a single pass. A line
+        # is filled if it starts with the field to be filled.
 
-        with open(self.path.replace(".raw", ".raw.hdr"), "w+") as outstream:
-            for string in template:
-                for filler, blank in zip(fillers, blanks):
-                    string = self.fill_blank(blank, string, filler)
+        header_path = self.stem_path + ".raw.hdr"
+
+        with open(header_template, "r") as instream, open(header_path, "w+") as outstream:
+            for line in instream:
+                line = line.strip()
+                for blank, filler in blanks_fillers:
+                    if line.startswith(blank):
+                        line = " ".join([line, filler])
+                        break
 
-                outstream.write(string + "\n")
+                outstream.write(line + "\n")
 
         self.logger.info("Header constructed.")
         self.logger.info(
@@ -329,17 +405,12 @@ class Filterbank(object):
 
         # Create a symbolic link between the "*.raw" file and a "*.raw.gmrt_dat" file.
 
-        cmd_symb = "ln -s {}".format(
-            " ".join([self.path, self.path.replace(".raw", ".raw.gmrt_dat")])
-        )
-        arg_symb = shlex.split(cmd_symb)
-        proc_symb = subprocess.Popen(arg_symb)
-        proc_symb.wait()
+        os.symlink(self.path, self.stem_path + ".raw.gmrt_dat")
 
-    def gmrt_psr_tool(self, template_path):
+    def copy_gptool_template(self, template_path):
 
-        """Run GPTool. The GMRT Pulsar Tool is RFI mitigation module built in-house at NCRA
-        for removing RFI directly from raw data files.
+        """Copy the appropriate GPTool template, according to backend, to the
+        current working directory, where GPTool expects to find it.
 
         Parameters:
         -----------
@@ -348,19 +419,26 @@ class Filterbank(object):
             Filtered by backend.
         """
 
-        self.logger.info("Starting RFI mitigation using GPTool.")
-
-        # Copy appropriate GPTool template, according to backend.
-
-        cmd_cp = "cp {} {}".format(
+        shutil.copy(
             os.path.join(
                 template_path, ".".join(["gptool", self.config.backend, "in"])
             ),
             "./gptool.in",
         )
-        arg_cp = shlex.split(cmd_cp)
-        proc_cp = subprocess.Popen(arg_cp)
-        proc_cp.wait()
+
+    def gmrt_psr_tool(self, template_path):
+
+        """Run GPTool. The GMRT Pulsar Tool is RFI mitigation module built in-house at NCRA
+        for removing RFI directly from raw data files.
+
+        Parameters:
+        -----------
+        template_path: str or Path-like
+            The absolute path to all template files.
+            Filtered by backend.
+        """
+
+        self.logger.info("Starting RFI mitigation using GPTool.")
 
         # Run GPTool.
         if self.config.backend == "GWB":
@@ -380,10 +458,9 @@ class Filterbank(object):
         #                                      '32',
         #                                      self.config.cores)
         arg_gptool = shlex.split(cmd_gptool)
-        proc_gptool = subprocess.Popen(
-            arg_gptool, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        subprocess.run(
+            arg_gptool, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
         )
-        proc_gptool.wait()
 
         self.logger.info("Done with RFI mitigation.")
         self.logger.info(
@@ -393,21 +470,14 @@ class Filterbank(object):
 
         # Delete previous symbolic link between "*.raw" and "*.raw.gmrt_dat" file.
 
-        os.remove(self.path.replace(".raw", ".raw.gmrt_dat"))
+        os.remove(self.stem_path + ".raw.gmrt_dat")
 
         # Form new symbolic link between "*.raw.gpt" and "*.raw.gmrt_dat" file.
 
-        cmd_symb = "ln -s {}".format(
-            " ".join(
-                [
-                    self.path.replace(".raw", ".raw.gpt"),
-                    self.name.replace(".raw", ".raw.gmrt_dat"),
-                ]
-            )
+        os.symlink(
+            self.stem_path + ".raw.gpt",
+            self.output_name + ".raw.gmrt_dat",
         )
-        arg_symb = shlex.split(cmd_symb)
-        proc_symb = subprocess.Popen(arg_symb)
-        proc_symb.wait()
 
     def create_filterbank(self):
 
@@ -420,24 +490,18 @@ class Filterbank(object):
 
         # Copy header file to current working directory.
 
-        cmd_cp = "cp {} {}".format(
-            self.path.replace(".raw", ".raw.hdr"),
-            self.name.replace(".raw", ".raw.gmrt_hdr"),
+        shutil.copy(
+            self.stem_path + ".raw.hdr",
+            self.output_name + ".raw.gmrt_hdr",
         )
-        arg_cp = shlex.split(cmd_cp)
-        proc_cp = subprocess.Popen(arg_cp)
-        proc_cp.wait()
 
         # Create filterbank file.
 
-        cmd_filbnk = "filterbank {} > {}".format(
-            self.name.replace(".raw", ".raw.gmrt_dat"),
-            self.path.replace(".raw", ".fil"),
-        )
-        proc_filbnk = subprocess.Popen(
-            cmd_filbnk, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-        )
-        proc_filbnk.wait()
+        arg_filbnk = ["filterbank", self.output_name + ".raw.gmrt_dat"]
+        with open(self.stem_path + ".fil", "wb") as outstream:
+            subprocess.run(
+                arg_filbnk, stdout=outstream, stderr=subprocess.DEVNULL, check=True
+            )
 
         self.logger.info(
             "Filterbank file created. "
@@ -446,13 +510,21 @@ class Filterbank(object):
 
         # Delete ALL GPTool-associated files and the symbolic link.
 
-        proc_rm_gpt_cwd = subprocess.Popen("rm -rf *gpt*", shell=True)
-        proc_rm_gpt = subprocess.Popen(
-            "rm -rf {}".format(os.path.join(os.path.dirname(self.path), "*gpt*")),
-            shell=True,
-        )
-        os.remove(self.name.replace(".raw", ".raw.gmrt_dat"))
-        os.remove(self.name.replace(".raw", ".raw.gmrt_hdr"))
+        # The working directory may be the raw file's directory, so match
+        # each path only once.
+
+        gpt_paths = {
+            os.path.abspath(gpt_path)
+            for gpt_dir in (os.getcwd(), os.path.dirname(self.path))
+            for gpt_path in glob.glob(os.path.join(gpt_dir, "*gpt*"))
+        }
+        for gpt_path in gpt_paths:
+            if os.path.isdir(gpt_path) and not os.path.islink(gpt_path):
+                shutil.rmtree(gpt_path, ignore_errors=True)
+            else:
+                os.remove(gpt_path)
+        os.remove(self.output_name + ".raw.gmrt_dat")
+        os.remove(self.output_name + ".raw.gmrt_hdr")
 
     def zeroDM_filtering(self):
 
@@ -465,17 +537,11 @@ class Filterbank(object):
 
             self.logger.info("Start zeroDM filtering, since backend is GSB.")
 
-            cmd_zdm = "zerodm {} > {}".format(
-                self.path.replace(".raw", ".fil"),
-                self.path.replace(".raw", ".zeroDM.fil"),
-            )
-            proc_zdm = subprocess.Popen(
-                cmd_zdm,
-                shell=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-            proc_zdm.wait()
+            arg_zdm = ["zerodm", self.stem_path + ".fil"]
+            with open(self.stem_path + ".zeroDM.fil", "wb") as outstream:
+                subprocess.run(
+                    arg_zdm, stdout=outstream, stderr=subprocess.DEVNULL, check=True
+                )
 
             self.logger.info("Done with zeroDM filtering.")
 
@@ -487,17 +553,27 @@ class Filterbank(object):
 
             self.logger.info(
                 "Starting creation of the filterbank file from "
-                "the raw file, {}".format(self.name)
+                "the raw file, %s",
+                self.name,
             )
 
             template_path = os.path.join(
                 self.config.preprocessing_path, self.config.backend
             )
 
-            # Header creation.
+            # Header creation. The GPTool template is copied and the date/time
+            # parameters are calculated in the background, while the coordinates
+            # are looked up, since none of these depend on each other.
+
+            with ThreadPoolExecutor(max_workers=2) as tpe:
+                futures = [
+                    tpe.submit(self.copy_gptool_template, template_path),
+                    tpe.submit(self.calc_time_params),
+                ]
+                self.store_coords()
+                for future in futures:
+                    future.result()
 
-            self.calc_time_params()
-            self.store_coords()
             self.fill_template(template_path)
 
             # RFI mitigation using GPTool and filterbank creation.
@@ -515,13 +591,13 @@ class Filterbank(object):
 
             if (self.config.backend == "GWB") or (self.config.backend == "SIM"):
 
-                self.name = self.name.replace(".raw", ".fil")
-                self.path = self.path.replace(".raw", ".fil")
+                self.name = self.output_name + ".fil"
+                self.path = self.stem_path + ".fil"
 
             else:
 
-                self.name = self.name.replace(".raw", ".zeroDM.fil")
-                self.path = self.path.replace(".raw", ".zeroDM.fil")
+                self.name = self.output_name + ".zeroDM.fil"
+                self.path = self.stem_path + ".zeroDM.fil"
 
     def make_dirs(self):
 
@@ -541,37 +617,36 @@ class Filterbank(object):
 
         """Load variables from the filterbank header.
 
-        Uses the in-built "header" script and the "grep" and "awk" utilities
+        Uses the in-built "header" script, and parses its output
         to extract the header variables.
         """
 
         # Reading the header of the given filterbank file using the "header"
-        # command and getting the required parameters by piping the output into
-        # "grep"s for each parameter.
+        # command, once, and picking out the first line for each parameter.
 
         self.logger.info("Extract all variables from the header.")
 
-        cmd1 = "header " + self.path
-        cmd2 = []
-        cmd2.append("grep 'Frequency of channel 1'")
-        cmd2.append("grep 'Channel bandwidth'")
-        cmd2.append("grep 'Number of channels'")
-        cmd2.append("grep 'Sample time'")
-        cmd2.append("grep 'Observation length'")
-        cmd3 = "awk -F: '{print $2}'"
+        fields = [
+            "Frequency of channel 1",
+            "Channel bandwidth",
+            "Number of channels",
+            "Sample time",
+            "Observation length",
+        ]
+
+        output = subprocess.run(
+            ["header", self.path], capture_output=True, text=True, check=True
+        ).stdout
 
-        arg1 = shlex.split(cmd1)
-        arg2 = []
-        arg2 = [shlex.split(i) for i in cmd2]
-        arg3 = shlex.split(cmd3)
+        values = {}
 
-        variables = []
+        for line in output.splitlines():
+            key, _, value = line.partition(":")
+            for field in fields:
+                if (field not in values) and (field in key):
+                    values[field] = float(value.split()[0])
 
-        for i in range(len(cmd2)):
-            p1 = subprocess.Popen(arg1, stdout=subprocess.PIPE)
-            p2 = subprocess.Popen(arg2[i], stdin=p1.stdout, stdout=subprocess.PIPE)
-            p3 = subprocess.Popen(arg3, stdin=p2.stdout, stdout=subprocess.PIPE)
-            variables.append(float(p3.communicate()[0].decode("utf-8").split()[0]))
+        variables = [values[field] for field in fields]
 
         self.BW = round(-1 * variables[1] * variables[2])  # Bandwidth.
         self.CFREQ = variables[0] - (self.BW / 2)  # Central frequency.
@@ -587,11 +662,14 @@ class Filterbank(object):
 
         Parameters:
         -----------
-        dm_segment: list
-            A pair of start and end DM values across which dedispersion is
-            to be carried out.
+        dm_segment: tuple
+            The lowest DM of the segment, and the number of DM trials in it.
+            Dedispersion is carried out across that many DM trials, starting
+            from the lowest DM.
         """
 
+        dm_low, num_dms = dm_segment
+
         TSAMP = float(self.TSAMP) / 1e6
         NUMOUT = int(
             round((self.OBSVT * 60) / TSAMP / self.config.ddplan["DS"] / 1000) * 1000
@@ -602,19 +680,18 @@ class Filterbank(object):
             "-downsamp {} {} -o {}"
         ).format(
             NUMOUT,
-            dm_segment,
+            dm_low,
             self.config.ddplan["dDM"],
-            self.dm_trials,
+            num_dms,
             self.config.ddplan["nsub"],
             self.config.ddplan["DS"],
             self.path,
             os.path.join(self.timeseries_path, self.output_name),
         )
         arg_dedisp = shlex.split(cmd_dedisp)
-        proc_dedisp = subprocess.Popen(
-            arg_dedisp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        subprocess.run(
+            arg_dedisp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
         )
-        proc_dedisp.wait()
 
     def para_dedisp(self):
 
@@ -628,27 +705,41 @@ class Filterbank(object):
         dDM = self.config.ddplan["dDM"]
         numDMs = self.config.ddplan["numDMs"]
 
+        # Split the DM space into one chunk per core; each segment starts at the
+        # first DM of its chunk and spans exactly the trials in that chunk, since
+        # "array_split" makes the later chunks one trial shorter than the first.
+
         dm_sequence = np.arange(DM_lowest, DM_highest, dDM)
-        segment_length = float(DM_highest - DM_lowest) / self.config.cores
+        dm_chunks = np.array_split(dm_sequence, self.config.cores)
 
-        self.dm_trials = int(float(numDMs) / self.config.cores)
         self.dm_segments = [
-            segments
-            for segments in step_iter(
-                dm_sequence, DM_lowest, DM_highest, segment_length
-            )
+            (float(chunk[0]), len(chunk)) for chunk in dm_chunks if len(chunk)
         ]
 
         self.logger.info(
-            "Starting dedispersion. Parallely running {:d} worker processes "
-            "across {:d} DM trials.".format(len(self.dm_segments), numDMs)
+            "Starting dedispersion. Parallely running %d worker processes "
+            "across %d DM trials.",
+            len(self.dm_segments),
+            numDMs,
         )
-        with Pool() as pool:
-            [p for p in pool.map(self.segmented_dedisp, self.dm_segments)]
+        with Pool(max_workers=self.config.cores) as pool:
+            processes = [
+                pool.submit(self.segmented_dedisp, dm_segment)
+                for dm_segment in self.dm_segments
+            ]
+            wait(processes)
+
+        # Raise any error hit while dedispersing a segment.
+
+        for process in processes:
+            process.result()
+
+        self.recount("proc_dm_trials")
 
         self.logger.info(
             "Done with dedispersion. "
-            "Number of DM trials processed: {:d}".format(self.proc_dm_trials)
+            "Number of DM trials processed: %d",
+            self.proc_dm_trials,
         )
 
         self._attrs_["proc_dm_trials"] = self.proc_dm_trials
@@ -661,7 +752,8 @@ class Filterbank(object):
         """
 
         self.logger.info(
-            "Starting the FFA search on {:d} timeseries.".format(self.proc_dm_trials)
+            "Starting the FFA search on %d timeseries.",
+            self.proc_dm_trials,
         )
 
         ffa_module_path = os.path.join(self.config.scripts_path, "pipeline.py")
@@ -670,23 +762,32 @@ class Filterbank(object):
             self.config.configurations_path, "ffa_config", "manager_config.yaml"
         )
 
-        glob_pattern = os.path.join(self.timeseries_path, '"*.inf"')
-
-        # Run the "pipeline.py" script.
-
-        proc_ffa = subprocess.Popen(
-            "python {} {} {} {}".format(
-                ffa_module_path, ffa_config_path, glob_pattern, self.cands_path
-            ),
-            shell=True,
+        glob_pattern = os.path.join(self.timeseries_path, "*.inf")
+
+        # Run the "pipeline.py" script, with as many worker processes as
+        # there are cores available to this date.
+
+        subprocess.run(
+            [
+                "python",
+                ffa_module_path,
+                ffa_config_path,
+                glob_pattern,
+                self.cands_path,
+                "--num_processes",
+                str(self.config.cores),
+            ],
+            check=True,
         )  # ,
         # stdout = subprocess.DEVNULL,
         # stderr = subprocess.DEVNULL)
-        proc_ffa.communicate()
+
+        self.recount("num_candidates")
 
         self.logger.info(
             "Done with the FFA search. "
-            "{:d} candidates generated.".format(self.num_candidates)
+            "%d candidates generated.",
+            self.num_candidates,
         )
 
         self._attrs_["num_candidates"] = self.num_candidates
@@ -694,40 +795,33 @@ class Filterbank(object):
     def plot_candidates(self):
 
         """Plots are created for all output candidates and compiled into one PDF file.
-        Candidates are plotted in batches. Each batch has as many candidates as the
+        Candidates are plotted parallely, across as many worker processes as the
         number of cores available per node.
         """
 
         self.logger.info(
-            "Plotting all candidates in batches of {:d}.".format(self.config.cores)
+            "Plotting all candidates parallely, across %d worker processes.",
+            self.config.cores,
         )
 
-        #
-
-        matplotlib.use("Agg")
-
-        # Disable the "too many figures open" warning raised by "matplotlib".
-
-        matplotlib.pyplot.rcParams.update({"figure.max_open_warning": 0})
-
-        candidates = []
-
         candidates = filter_by_ext(self.cands_path, extension=".h5")
-        plot_batches = grouper(candidates, self.config.cores)
 
         plot_path = os.path.join(self.cands_path, "candidate_plts.pdf")
         images_path = os.path.join(self.cands_path, "png")
 
         os.makedirs(images_path, exist_ok=True)
 
-        for plot_batch in plot_batches:
-
-            for candidate in plot_batch:
+        plot_jobs = [
+            (
+                candidate.path,
+                os.path.join(images_path, candidate.name.replace(".h5", ".png")),
+            )
+            for candidate in candidates
+        ]
 
-                cand_plot_obj = CandidatePlot(Candidate.load_hdf5(candidate.path))
-                cand_plot_obj.saveimg(
-                    os.path.join(images_path, candidate.name.replace(".h5", ".png"))
-                )
+        with Pool(max_workers=self.config.cores) as pool:
+            for _ in pool.map(render_candidate, plot_jobs):
+                pass
 
         self.logger.info(
             "All candidates plotted. "
@@ -737,27 +831,18 @@ class Filterbank(object):
 
         # Turn all PNG files into a single PDF and delete the "png" directory.
 
-        make_pdf(images_path, plot_path)
-        proc_rm = subprocess.Popen(
-            "rm -rf {}".format(images_path),
-            shell=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
+        make_pdf(images_path, plot_path, max_workers=self.config.cores)
+        shutil.rmtree(images_path, ignore_errors=True)
 
         # Delete all timeseries because we are done with them now.
 
-        [
+        for timeseries in filter_by_ext(self.timeseries_path, extension=".dat"):
             os.remove(timeseries)
-            for timeseries in filter_by_ext(self.timeseries_path, extension=".dat")
-        ]
 
         # And their headers too.
 
-        [
+        for headers in filter_by_ext(self.timeseries_path, extension=".inf"):
             os.remove(headers)
-            for headers in filter_by_ext(self.timeseries_path, extension=".inf")
-        ]
 
         self.logger.info("Done with plotting. Delete all timeseries.")
 
@@ -771,36 +856,25 @@ class Filterbank(object):
         if cand_DM > 400:
             num_sub = 256
         else:
-            num_sub = self.config.folding_params["NSUBCHAN"]
-
-        if cand_P >= 1000.0:
-            cmd_fold = (
-                "prepfold -dm {} -p {} -pd {} -pdd {} -nosearch -topo -slow -n {} -nsub {} -npart {} -noxwin {} -o {}"
-            ).format(
-                cand_DM,
-                cand_P,
-                self.config.folding_params["PD"],
-                self.config.folding_params["PDD"],
-                self.config.folding_params["NUMBINS"],
-                num_sub,
-                self.config.folding_params["NPART"],
-                self.path,
-                self.output_name + "_dm_" + str(cand_DM),
-            )
-        else:
-            cmd_fold = (
-                "prepfold -dm {} -p {} -pd {} -pdd {} -nosearch -topo -n {} -nsub {} -npart {} -noxwin {} -o {}"
-            ).format(
-                cand_DM,
-                cand_P,
-                self.config.folding_params["PD"],
-                self.config.folding_params["PDD"],
-                self.config.folding_params["NUMBINS"],
-                num_sub,
-                self.config.folding_params["NPART"],
-                self.path,
-                self.output_name + "_dm_" + str(cand_DM),
-            )
+            num_sub = self.fold_nsub
+
+        # Long period candidates are folded with the "-slow" option.
+
+        PD, PDD, NUMBINS, NPART = self.fold_params
+        cmd_fold = (
+            "prepfold -dm {} -p {} -pd {} -pdd {} -nosearch -topo {}-n {} -nsub {} -npart {} -noxwin {} -o {}"
+        ).format(
+            cand_DM,
+            cand_P,
+            PD,
+            PDD,
+            "-slow " if cand_P >= 1000.0 else "",
+            NUMBINS,
+            num_sub,
+            NPART,
+            self.path,
+            self.output_name + "_dm_" + str(cand_DM),
+        )
 
         #        cmd_fold = ('prepfold -dm {} -p {} -pd {} -pdd {} -nosearch -n {} -nsub {} -npart {} -noxwin {} '
         #                    '-o {}').format(cand_DM,
@@ -814,23 +888,22 @@ class Filterbank(object):
         #                                    self.output_name)
 
         arg_fold = shlex.split(cmd_fold)
-        proc_fold = subprocess.Popen(
-            arg_fold, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        subprocess.run(
+            arg_fold, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
         )
-        proc_fold.wait()
 
     def fold_profiles(self):
 
-        """Fold all output candidates. Candidates are divided into batches. Each batch
-        is then folded parallely across the available cores in each node. This is done
-        until all candidates have been folded.
+        """Fold all output candidates. Candidates are folded parallely across the
+        available cores in each node, by a single pool of worker processes, until
+        all candidates have been folded.
         """
 
         self.logger.info(
-            "Start folding {:d} candidates. "
-            "Fold {:d} candidates parallely.".format(
-                self.num_candidates, self.config.cores
-            )
+            "Start folding %d candidates. "
+            "Fold %d candidates parallely.",
+            self.num_candidates,
+            self.config.cores,
         )
 
         # Change to directory where folded profiles are to be stored.
@@ -838,41 +911,54 @@ class Filterbank(object):
         cwd = os.getcwd()
         os.chdir(self.fold_prf_path)
 
-        candidate_paths = filter_by_ext(self.cands_path, extension=".h5")
-        candidate_batches = grouper(candidate_paths, self.config.cores)
+        # A single pool is used for all candidates. Its queue already keeps
+        # at most as many candidates folding at once as there are cores.
 
-        for candidate_batch in candidate_batches:
+        candidate_paths = filter_by_ext(self.cands_path, extension=".h5")
 
-            processes = []
+        try:
 
             with Pool(max_workers=self.config.cores) as pool:
-                [
-                    processes.append(pool.submit(self.fold_candidate, cand.path))
-                    for cand in candidate_batch
+                processes = [
+                    pool.submit(self.fold_candidate, cand.path) for cand in candidate_paths
                 ]
-                wait(processes)
 
-        self.logger.info(
-            "All candidates folded. "
-            "Compile all plots into single PDF file. "
-            "Delete all PS files."
-        )
+                # Raise any error hit while folding a candidate.
 
-        # Use "ghostscript" to combine all .ps files into a single PDF.
+                for process in as_completed(processes):
+                    process.result()
 
-        proc_ps_combine = subprocess.Popen(
-            "gs -sDEVICE=pdfwrite -dNOPAUSE -dBATCH -dSAFER "
-            "-sOutputFile=fold_candidates.pdf *.ps",
-            shell=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
+                self.logger.info(
+                    "All candidates folded. "
+                    "Compile all plots into single PDF file."
+                )
+
+                # Convert the PostScript plot of each folded candidate to PDF parallely,
+                # using the same pool.
+
+                ps_paths = sorted(
+                    ps_file.path
+                    for ps_file in filter_by_ext(self.fold_prf_path, extension=".ps")
+                )
+                pdf_paths = list(pool.map(ps_to_pdf, ps_paths))
+
+            # Merge them into a single PDF, and delete the per-candidate PDFs.
+
+            if pdf_paths:
+                merge_pdfs(pdf_paths, os.path.join(self.fold_prf_path, "fold_candidates.pdf"))
+
+            for pdf_path in pdf_paths:
+                os.remove(pdf_path)
+
+        finally:
+
+            # Change back to current working directory, even if folding failed.
 
-        # Change back to current working directory.
+            os.chdir(cwd)
 
-        os.chdir(cwd)
+        self.recount("num_fold_prfs")
 
-        self.logger.info("Folding done for {:d} candidates.".format(self.num_fold_prfs))
+        self.logger.info("Folding done for %d candidates.", self.num_fold_prfs)
 
         self._attrs_["num_fold_prfs"] = self.num_fold_prfs
 
@@ -880,17 +966,13 @@ class Filterbank(object):
 
         """ Archive all folded profiles using the "PSRCHIVE" module. """
 
-        self.logger.info("Archive {:d} folded profiles.".format(self.num_fold_prfs))
+        self.logger.info("Archive %d folded profiles.", self.num_fold_prfs)
 
         fold_prfs = filter_by_ext(self.fold_prf_path, extension=".pfd")
         fold_prf_paths = [fold_prf.path for fold_prf in fold_prfs]
 
-        cmd_arvs = []
-        arg_arvs = []
-        proc_arvs = []
-
-        [
-            cmd_arvs.append(
+        arg_arvs = [
+            shlex.split(
                 "pam -q -a PRESTO {} -e archive -u {}".format(
                     fold_prf_path, self.arv_prf_path
                 )
@@ -898,21 +980,31 @@ class Filterbank(object):
             for fold_prf_path in fold_prf_paths
         ]
 
-        [arg_arvs.append(shlex.split(cmd_arv)) for cmd_arv in cmd_arvs]
+        # Run at most as many "pam" processes at once as there are cores. The
+        # work is done by the external "pam" processes, so threads are enough
+        # to wait on them. A profile that fails to archive is logged, and the
+        # rest are still archived.
 
-        [
-            proc_arvs.append(
-                subprocess.Popen(
-                    arg_arv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-                )
-            )
-            for arg_arv in arg_arvs
-        ]
-        [proc_arv.wait() for proc_arv in proc_arvs]
+        with ThreadPoolExecutor(max_workers=self.config.cores) as pool:
+            processes = {
+                pool.submit(archive_profile, arg_arv): fold_prf_path
+                for arg_arv, fold_prf_path in zip(arg_arvs, fold_prf_paths)
+            }
 
-        self.logger.info(
-            "Archiving done for {:d} candidates.".format(self.num_arv_prfs)
-        )
+            for process in as_completed(processes):
+                try:
+                    process.result()
+                except subprocess.CalledProcessError as err:
+                    self.logger.error(
+                        "Failed to archive %s (pam exited with code %d): %s",
+                        processes[process],
+                        err.returncode,
+                        (err.stderr or b"").decode(errors="replace").strip(),
+                    )
+
+        self.recount("num_arv_prfs")
+
+        self.logger.info("Archiving done for %d candidates.", self.num_arv_prfs)
 
         self._attrs_["num_arv_prfs"] = self.num_arv_prfs
 
@@ -924,7 +1016,7 @@ class Filterbank(object):
 
         """ Start processing the filterbank file. """
 
-        self.logger.info("Start processing {}.".format(self.output_name))
+        self.logger.info("Start processing %s.", self.output_name)
         start_time = timeit.default_timer()
 
         self.make_fil()
@@ -941,5 +1033,5 @@ class Filterbank(object):
 
         end_time = timeit.default_timer()
         self._cumulative_walltime = end_time - start_time
-        self.logger.info("Done processing {}.".format(self.output_name))
-        self.logger.info("Total processing time: {}".format(self.cumulative_walltime()))
+        self.logger.info("Done processing %s.", self.output_name)
+        self.logger.info("Total processing time: %s", self.cumulative_walltime())
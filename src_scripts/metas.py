@@ -20,6 +20,10 @@ class Meta(dict):
         "num_arv_prfs": int,
     }
 
+    # Same, as a tuple of (key, type) pairs, so that it is only built once.
+
+    _required_items_ = tuple(_required_attrs_.items())
+
     def __init__(self, attrs):
 
         """Create new Meta from a filterbank file.
@@ -49,13 +53,10 @@ class Meta(dict):
         be set to None, or present with the correct type.
         """
 
-        req = self._required_attrs_
-        for key in req.keys():
-            val = self.get(key, None)
-            if val is None:
-                self[key] = val
-            elif not isinstance(val, req[key]):
+        for key, kind in self._required_items_:
+            val = self.setdefault(key, None)
+            if val is not None and not isinstance(val, kind):
                 msg = "Meta key '{k:s}' must have type '{t:s}' instead of '{ti:s}'".format(
-                    k=key, t=req[key].__name__, ti=type(val).__name__
+                    k=key, t=kind.__name__, ti=type(val).__name__
                 )
                 raise ValueError(msg)
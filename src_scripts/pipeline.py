@@ -2,18 +2,27 @@
 
 ### Standard imports ###
 import os
+import copy
 import glob
 import logging
 import argparse
-import itertools
+import functools
 import operator
 import timeit
+import pickle
+import csv
 from multiprocessing import Pool
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
 
 ### Non-standard imports ###
 import yaml
 import numpy as np
-import pandas
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 ### Local imports ###
 from riptide import TimeSeries, ffa_search, find_peaks
@@ -24,7 +33,7 @@ from riptide.pipelines.harmonic_filtering import flag_harmonics
 
 def parse_yaml_config(fname):
     with open(fname, 'r') as fobj:
-        config = yaml.load(fobj)
+        config = yaml.load(fobj, Loader=SafeLoader)
     return config
 
 
@@ -50,49 +59,57 @@ def get_lower_dm_limit(dm_trials, dm_min=None):
         return min(dm_trials)
  
 def get_galactic_dm_limit(glat_radians, dmsinb_max, eps=1e-6):
-    return dmsinb_max / (np.sin(abs(glat_radians)) + eps)
+    """ Works on a single galactic latitude, or on an array of them. """
+    return dmsinb_max / (np.sin(np.abs(glat_radians)) + eps)
  
-def get_upper_dm_limit(dm_trials, glat_radians, dm_max=None, dmsinb_max=None, eps=1e-6):
-    """ 'dm_max' is the maximum DM enforced by the user, and 'dmsinb_max' the maximum
-   value of DM x sin |b| allowed. """
-    result = max(dm_trials)
+def get_upper_dm_limits(dm_trials, glat_radians, dm_max=None, dmsinb_max=None, eps=1e-6):
+    """ Same as get_upper_dm_limit(), for an array of galactic latitudes (e.g.
+    one per pointing) at once. Returns an array of upper DM limits. """
+    glat_radians = np.asarray(glat_radians, dtype=np.float64)
+    result = np.full(glat_radians.shape, max(dm_trials), dtype=np.float64)
     if dm_max is not None:
-        result = min(result, dm_max)
+        result = np.minimum(result, dm_max)
     if dmsinb_max is not None:
-        result = min(result, get_galactic_dm_limit(glat_radians, dmsinb_max))
+        result = np.minimum(result, get_galactic_dm_limit(glat_radians, dmsinb_max, eps=eps))
     return result
 
-def grouper(iterable, n):
-    """ Iterate through iterable, yielding groups of n elements. The last
-    group may have less than n elements. """
-    # we want izip_longest() in python 2.x
-    # or zip_longest() in python 3.x
-    if hasattr(itertools, 'zip_longest'):
-        zipper = itertools.zip_longest
-    else:
-        zipper = itertools.izip_longest
-    args = [iter(iterable)] * n
-    for group in zipper(*args, fillvalue=None):
-        filtered_group = [val for val in group if val is not None]
-        yield filtered_group
-
-def sort_dataframe_by_column(df, column):
-    """ Utility function that handles the change in pandas API made in version
-    0.17.0, where DataFrame.sort() was replaced by DataFrame.sort_values()."""
-    if hasattr(df, 'sort_values'):
-        return df.sort_values(column)
-    else:
-        return df.sort(column)
+def get_upper_dm_limit(dm_trials, glat_radians, dm_max=None, dmsinb_max=None, eps=1e-6):
+    """ 'dm_max' is the maximum DM enforced by the user, and 'dmsinb_max' the maximum
+   value of DM x sin |b| allowed. """
+    return float(get_upper_dm_limits(dm_trials, glat_radians, dm_max=dm_max, dmsinb_max=dmsinb_max, eps=eps))
+
+@functools.lru_cache(maxsize=1)
+def load_prepared_time_series(loader, fname, rmed_width, rmed_minpts):
+    """ Load a TimeSeries, and run the same pre-processing on it as was done
+    before searching it. The last TimeSeries loaded is cached, so that
+    consecutive calls for the same file only load and pre-process it once. """
+    tseries = loader(fname)
+    tseries.deredden(rmed_width, minpts=rmed_minpts, inplace=True)
+    tseries.normalise(inplace=True)
+    return tseries
+
+def write_table(fname, columns, rows):
+    """ Write rows of values to a tab-separated CSV file, one row at a time.
+    Floating point values are written with 8 decimal places. """
+    with open(fname, 'w', newline='') as fobj:
+        writer = csv.writer(fobj, delimiter='\t', lineterminator='\n')
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([
+                '{:.8f}'.format(value) if isinstance(value, (float, np.floating)) else value
+                for value in row
+                ])
 
 
 class DetectionCluster(list):
-    """ Cluster of Detection objects. """
+    """ Cluster of Detection objects. The top (highest S/N) Detection and its
+    parameters are found once, on creation. """
     def __init__(self, detections):
         super(DetectionCluster, self).__init__(detections)
-
-    @property
-    def top_detection(self):
-        return max(self, key=operator.attrgetter('snr'))
+        self.top_detection = max(self, key=operator.attrgetter('snr'))
+        self.snr = self.top_detection.snr
+        self.dm = self.top_detection.dm
+        self.period = self.top_detection.period
 
     def to_dict(self):
         t = self.top_detection
@@ -126,13 +143,95 @@ class PulsarSearchWorker(object):
         """
         self.config = config
 
+        # Bind the search and detection parameters once, rather than looking
+        # them up and unpacking them again for every TimeSeries
+        self.search = functools.partial(ffa_search, **config['search'])
+        self.detect = functools.partial(find_peaks, **config['detect'])
+
+    # Detection metadata used later on by the PipelineManager. Everything
+    # else (e.g. sky coordinates) is dropped before the Detections are sent
+    # back to the parent process.
+    METADATA_KEYS = ('tobs', 'fname')
+
     def __call__(self, tseries):
-        ts, plan, pgram = ffa_search(tseries, **self.config['search'])
-        dets = find_peaks(pgram, **self.config['detect'])
+        ts, plan, pgram = self.search(tseries)
+        dets = self.detect(pgram)
+
+        # All Detections share the metadata of the TimeSeries, so a single
+        # slimmed-down copy is enough
+        if dets:
+            metadata = {key: dets[0].metadata[key] for key in self.METADATA_KEYS}
+            for det in dets:
+                det.metadata = metadata
         return dets
 
 
 
+class MultiSearchWorker(object):
+    """ Function-like object that takes a single TimeSeries as an argument,
+    runs every configured search on it, and outputs a list of lists of
+    detections, one list per search. This way each TimeSeries is sent to a
+    worker process only once, however many searches there are.
+    """
+    def __init__(self, configs):
+        """
+        Parameters:
+            configs : list
+                Configuration parameters of every PulsarSearch object, in the
+                order in which their detections are to be returned.
+        """
+        self.workers = [PulsarSearchWorker(config) for config in configs]
+
+    def __call__(self, tseries):
+        return [worker(tseries) for worker in self.workers]
+
+
+
+# MultiSearchWorker of each process in the pool. Set once, when the process
+# starts, so that the search configurations are not sent with every batch.
+_worker_ = None
+
+
+def _init_worker(configs):
+    """ Initialise the MultiSearchWorker of a process in the pool. """
+    global _worker_
+    _worker_ = MultiSearchWorker(configs)
+
+
+def share_time_series(tseries):
+    """ Copy the data of a TimeSeries into a new block of shared memory.
+    Returns the block, and a handle from which a worker process can rebuild
+    the TimeSeries on top of the shared data, without it being pickled. The
+    caller is responsible for closing and unlinking the block. """
+    data = tseries.data
+    shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+    np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)[:] = data
+    handle = (shm.name, data.shape, data.dtype.str, tseries.tsamp, tseries.metadata)
+    return shm, handle
+
+
+def _search_time_series(handle):
+    """ Run all searches on a single TimeSeries in shared memory using the
+    MultiSearchWorker of this process. """
+    name, shape, dtype, tsamp, metadata = handle
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        data = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        tseries = TimeSeries(data, tsamp, metadata=metadata)
+        detections = _worker_(tseries)
+        # Release all views of the block before closing it
+        del data, tseries
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            # Views are still held by an exception traceback; the block is
+            # unlinked by the parent process regardless
+            pass
+    return detections
+
+
+
 class PulsarSearch(object):
     """ Gets fed time series and accumulates detections at various DM trials
     during processing. Once processing is over, build clusters out of the
@@ -155,71 +254,53 @@ class PulsarSearch(object):
         self.manager = manager
         self.config = config
         self.configure_logger()
-        self._cumulative_walltime = 0.0
         self.detections = []
         self.clusters = []
 
+        # Observation times of all Detections, read once when clustering
+        self.tobs = None
+
     @property
     def name(self):
         return self.config['name']
 
-    @property
-    def num_processes(self):
-        return self.manager.config['num_processes']
-
-    def cumulative_walltime(self):
-        """ Returns the total amount of time spent in the
-        process_time_series_batch() method, in seconds. """
-        return self._cumulative_walltime
-
     def configure_logger(self):
         logger_name = '.'.join(['PulsarSearch', self.name])
         self.logger = get_logger(logger_name)
 
-    def process_time_series_batch(self, batch):
-        """ Processes several time series in parallel using the muliprocessing
-        module.
+    def add_detections(self, new_detections):
+        """ Accumulate the Detections found by this search in a batch of
+        time series.
 
         Parameters:
         -----------
-            batch: list
-                list of TimeSeries to process.
+            new_detections: list
+                list of lists of Detections, one list per TimeSeries.
         """
-        start_time = timeit.default_timer()
-        pool = Pool(processes=self.num_processes)
-
-        # Split the TimeSeries to search between processes
-        # 'output' is a list of lists of Detections
-        self.logger.info("Searching batch of {:d} TimeSeries using {:d} worker processes ...".format(len(batch), self.num_processes))
-        output = pool.map(PulsarSearchWorker(self.config), batch)
-        pool.close()
-        pool.join()
-
-        # Accumulate the new Detections
-        new_detections = [det for sublist in output for det in sublist]
+        new_detections = [det for sublist in new_detections for det in sublist]
         self.logger.info("Search complete. New detections: {:d}".format(len(new_detections)))
         self.detections = self.detections + new_detections
         self.logger.info("Total detections stored: {:d}".format(len(self.detections)))
 
-        end_time = timeit.default_timer()
-        self._cumulative_walltime += (end_time - start_time)
-        self.logger.info("Total processing time: {:.2f} seconds".format(self.cumulative_walltime()))
-
     def cluster_detections(self):
         self.logger.info("Clustering Detections ...")
         if not self.detections:
             self.logger.info("No Detections in store. Nothing to be done.")
             return
 
-        periods = np.asarray([det.period for det in self.detections])
-        tobs = np.median([det.metadata['tobs'] for det in self.detections])
-        dbi = tobs / periods
+        num_detections = len(self.detections)
+        periods = np.fromiter((det.period for det in self.detections), dtype=np.float64, count=num_detections)
+        self.tobs = np.fromiter((det.metadata['tobs'] for det in self.detections), dtype=np.float64, count=num_detections)
+        dbi = np.median(self.tobs) / periods
 
         clrad = self.config['detect']['peak_clustering_radius']
         cluster_indices = cluster_1d(dbi, clrad)
 
+        # Object array, so that each cluster is gathered by fancy indexing
+        detections = np.empty(num_detections, dtype=object)
+        detections[:] = self.detections
         self.clusters = [
-            DetectionCluster([self.detections[ii] for ii in indices])
+            DetectionCluster(detections[indices].tolist())
             for indices in cluster_indices
             ]
         self.logger.info("Clustering complete. Total Clusters: {0:d}".format(len(self.clusters)))
@@ -232,6 +313,7 @@ class PipelineManager(object):
     DETECTIONS_FILE_NAME = "detections.csv"
     CLUSTERS_FILE_NAME = "clusters.csv"
     SUMMARY_FILE_NAME = "summary.csv"
+    DM_INDEX_FILE_NAME = ".dm_index.pkl"
     CANDIDATE_NAME_PREFIX = "riptide_cand"
 
     def __init__(self, config_path, override_keys={}):
@@ -255,10 +337,21 @@ class PipelineManager(object):
         self.detections = []
         self.clusters = []
         self.candidates = []
-        
+        self.tobs_median = None
+
+        # Worker processes used to search the time series. Created at the
+        # start of run() and reused for all batches and all searches.
+        self.pool = None
+        self._cumulative_walltime = 0.0
+
         self.configure_loaders()
         self.configure_searches()
 
+    def cumulative_walltime(self):
+        """ Returns the total amount of time spent searching
+        time series, in seconds. """
+        return self._cumulative_walltime
+
     def configure_logger(self):
         logger_name = 'PipelineManager'
         self.logger = get_logger(logger_name)
@@ -285,33 +378,73 @@ class PipelineManager(object):
             raise ValueError("Invalid data format '{s}'".format(fmt))
         self.logger.info("Specified file format: {:s}".format(fmt))
 
+    def read_dm_trials(self, filenames):
+        """ Read the DM trial value of every input file, and return a dict
+        {dm: fname}. Values are cached in an index file in the output
+        directory, along with the modification time of the file they were
+        read from, so that only new or modified files have their headers
+        read again on later runs. Headers are read in parallel by a pool of
+        threads. """
+        fmt = self.config['data_format'].strip().lower()
+        index_path = os.path.join(self.config['outdir'], self.DM_INDEX_FILE_NAME)
+
+        try:
+            with open(index_path, 'rb') as fobj:
+                index = pickle.load(fobj)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            index = {}
+        if index.get('data_format') != fmt:
+            index = {'data_format': fmt, 'entries': {}}
+        entries = index['entries']
+
+        mtimes = {fname: os.stat(fname).st_mtime_ns for fname in filenames}
+        stale = [
+            fname for fname in filenames
+            if entries.get(fname, (None, None))[0] != mtimes[fname]
+            ]
+        self.logger.info("DM trial values cached for {:d} files. Reading {:d} headers ...".format(len(filenames) - len(stale), len(stale)))
+
+        if stale:
+            with ThreadPoolExecutor(max_workers=self.config['num_processes']) as executor:
+                for fname, dm in zip(stale, executor.map(self.dm_getter, stale)):
+                    entries[fname] = (mtimes[fname], dm)
+
+            try:
+                with open(index_path + '.tmp', 'wb') as fobj:
+                    pickle.dump(index, fobj, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(index_path + '.tmp', index_path)
+            except OSError as error:
+                self.logger.info("Could not save DM trial index to file {:s}: {!s}".format(index_path, error))
+
+        return {entries[fname][1]: fname for fname in filenames}
+
     def select_dm_trials(self):
         """ Build a list of files to process """
         glob_pattern = self.config['glob']
         filenames = sorted(glob.glob(glob_pattern))
         self.logger.info("Found a total of {:d} file names corresponding to specified pattern \"{:s}\"".format(len(filenames), glob_pattern))
         self.logger.info("Fetching DM trial values from headers. This may take a while ...")
-        dm_trials = {
-            self.dm_getter(fname): fname
-            for fname in filenames
-            }
+        dm_trials = self.read_dm_trials(filenames)
         self.logger.info("DM trial values have been read.")
  
-        # Helper iterator, used to select a sequence of DM trials according to
+        # Helper function, used to select a sequence of DM trials according to
         # config parameters
-        def iter_steps(sequence, vmin, vmax, step):
+        def select_steps(sequence, vmin, vmax, step):
             # Ignore steps outside of bounds
-            array = np.asarray(sorted(list(sequence)))
+            array = np.sort(np.fromiter(sequence, dtype=np.float64))
             mask = (array >= vmin) & (array <= vmax)
             array = array[mask]
  
-            # Yield values separated by at least 'step'
-            last = None
+            # Select values separated by at least 'step', jumping straight to
+            # the next one with a binary search
             rtol = 1e-7 # Deal with float rounding errors
-            for value in array:
-                if last is None or value - last >= step * (1-rtol):
-                    last = value
-                    yield value
+            selected = []
+            index = 0
+            while index < len(array):
+                selected.append(index)
+                next_index = np.searchsorted(array, array[index] + step * (1-rtol), side='left')
+                index = max(index + 1, next_index)
+            return array[selected]
  
         # Set max DM trial as a function of both the hard maximum limit and
         # dmsinb_max
@@ -338,23 +471,34 @@ class PipelineManager(object):
  
         self.logger.info("Selecting DM trials in range [{:.3f}, {:.3f}] with a minimum step of {:.3f}".format(dm_min, dm_max, dm_step))
  
-        # NOTE: this is an iterator
-        dm_trial_values = iter_steps(dm_trials.keys(), dm_min, dm_max, dm_step)
+        dm_trial_values = select_steps(dm_trials.keys(), dm_min, dm_max, dm_step)
         self.dm_trial_paths = [dm_trials[value] for value in dm_trial_values]
         self.logger.info("Selected {:d} DM trials to process".format(len(self.dm_trial_paths)))
 
     def iter_batches(self):
         """ Iterate through input time series in batches. Yields a list of
-        num_processes TimeSeries at each iteration. """
+        num_processes TimeSeries at each iteration. The next batch is read
+        from disk by a pool of threads while the current one is being
+        searched. """
         num_processes = self.config['num_processes']
         paths = self.dm_trial_paths
 
         num_dm_trials = len(paths)
         self.logger.info("Preparing to iterate through DM trials. Number of input files: {:d}". format(num_dm_trials))
 
-        for batch in grouper(paths, num_processes):
-            tsbatch = list(map(self.loader, batch))
-            yield tsbatch
+        # Threads rather than processes, so that the loaded TimeSeries do not
+        # have to be pickled back to the parent process
+        with ThreadPoolExecutor(max_workers=num_processes) as executor:
+            pending = None
+            for start in range(0, num_dm_trials, num_processes):
+                batch = paths[start:start + num_processes]
+                futures = [executor.submit(self.loader, fname) for fname in batch]
+                if pending is not None:
+                    yield [future.result() for future in pending]
+                pending = futures
+
+            if pending is not None:
+                yield [future.result() for future in pending]
 
 
     def fetch_detections(self):
@@ -368,6 +512,19 @@ class PipelineManager(object):
                 self.detections.append(det)
         self.logger.info("Fetched a total of {:d} Detections".format(len(self.detections)))
 
+        # Median observation time of all Detections, computed once here
+        # rather than every time it is needed. The observation times already
+        # read by each search when clustering are reused if available.
+        self.tobs_median = None
+        if self.detections:
+            if all(search.tobs is not None or not search.detections for search in self.searches):
+                tobs = np.concatenate([search.tobs for search in self.searches if search.detections])
+            else:
+                tobs = np.fromiter(
+                    (det.metadata['tobs'] for det in self.detections),
+                    dtype=np.float64, count=len(self.detections))
+            self.tobs_median = np.median(tobs)
+
     def fetch_clusters(self):
         """ Place all DetectionCluster objects from all the searches into a
         single list. Give each DetectionCluster a new attribute tracking
@@ -392,27 +549,32 @@ class PipelineManager(object):
 
         fmin = self.config['fmin']
         fmax = self.config['fmax']
-        tobs = np.median([det.metadata['tobs'] for det in self.detections])
+        tobs = self.tobs_median
         max_denominator = self.config['harmonic_filtering']['max_denominator']
         snr_tol = self.config['harmonic_filtering']['snr_tol']
         max_distance = self.config['harmonic_filtering']['max_distance']
 
-        self.clusters = sorted(self.clusters, key=lambda cl: cl.top_detection.snr, reverse=True)
+        self.clusters = sorted(self.clusters, key=operator.attrgetter('snr'), reverse=True)
         cparams = list(map(DetectionCluster.to_dict, self.clusters))
         cparams = flag_harmonics(
             cparams, 
             fmin=fmin, fmax=fmax, tobs=tobs, max_denom=max_denominator, 
             max_distance=max_distance, snr_tol=snr_tol)
 
-        fundamentals = []
-        for cl, par in zip(self.clusters, cparams):
-            if par["is_harmonic"]:
+        is_harmonic = np.fromiter((par["is_harmonic"] for par in cparams), dtype=bool, count=len(cparams))
+        clusters = np.empty(len(self.clusters), dtype=object)
+        clusters[:] = self.clusters
+        fundamentals = clusters[~is_harmonic].tolist()
+
+        # Only walk through the harmonics if they are going to be logged
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for index in np.flatnonzero(is_harmonic):
+                cl = self.clusters[index]
+                par = cparams[index]
                 fund = self.clusters[par["fundamental_index"]]
                 frac = par["fraction"]
                 msg = "{!s} is a harmonic of {!s} with period ratio {!s}".format(cl, fund, frac)
                 self.logger.debug(msg)
-            else:
-                fundamentals.append(cl)
 
         num_harmonics = len(self.clusters) - len(fundamentals)
         self.logger.info("Flagged {:d} harmonics".format(num_harmonics))
@@ -436,17 +598,17 @@ class PipelineManager(object):
         max_number = params['max_number']
 
         # NOTE: Don't forget to sort by decreasing S/N before applying the filters
-        self.clusters = sorted(self.clusters, key=lambda cl: cl.top_detection.snr, reverse=True)
+        self.clusters = sorted(self.clusters, key=operator.attrgetter('snr'), reverse=True)
 
         if dm_min:
             self._apply_candidate_filter(
                 "DM >= {:.2f}".format(dm_min),
-                lambda cl: cl.top_detection.dm >= dm_min)
+                lambda cl: cl.dm >= dm_min)
 
         if snr_min:
             self._apply_candidate_filter(
                 "S/N >= {:.2f}".format(snr_min),
-                lambda cl: cl.top_detection.snr >= snr_min)
+                lambda cl: cl.snr >= snr_min)
 
         if max_number:
             self.logger.info("Keeping only the top {:d} brightest candidates".format(max_number))
@@ -459,7 +621,12 @@ class PipelineManager(object):
         self.logger.info("Building Candidates ...")
         self.candidates = []
 
-        for cluster in self.clusters:
+        # Process clusters found by the same search in the same file one
+        # after the other, so that each file is loaded and pre-processed
+        # only once per search
+        clusters = sorted(self.clusters, key=lambda cl: (cl.top_detection.metadata['fname'], cl.search.name))
+
+        for cluster in clusters:
             search = cluster.search
 
             # Get the original parameters of the PulsarSearch that Found
@@ -474,58 +641,55 @@ class PipelineManager(object):
             fname = cluster.top_detection.metadata['fname']
 
             try:
-                tseries = self.loader(fname)
-                tseries.deredden(rmed_width, minpts=rmed_minpts, inplace=True)
-                tseries.normalise(inplace=True)
-
+                # Each candidate gets its own shallow copy of the cached TimeSeries,
+                # with its own metadata, so that candidates built from the same file
+                # never share (and modify) the same metadata.
+                cached = load_prepared_time_series(self.loader, fname, rmed_width, rmed_minpts)
+                tseries = copy.copy(cached)
+                tseries.metadata = copy.copy(cached.metadata)
                 candidate = Candidate.from_pipeline_output(cluster, tseries, nbins=nbins, nsubs=nsubs, logger=self.logger)
                 self.candidates.append(candidate)
             except Exception as error:
                 self.logger.error("ERROR: Failed to build candidate from {!s}. Reason: {!s}".format(cluster, error))
 
 
+        load_prepared_time_series.cache_clear()
+
         self.candidates = sorted(self.candidates, key=lambda cd: cd.metadata['best_snr'], reverse=True)
         self.logger.info("Done building candidates.")
 
 
     def save_detections(self):
-        """ Save detection parameters to pandas.DataFrame """
+        """ Save detection parameters to a CSV file """
         if not self.detections:
             return
 
         outdir = self.config['outdir']
         fname = os.path.join(outdir, self.DETECTIONS_FILE_NAME)
-        self.logger.info("Saving pandas.DataFrame with parameters of all {:d} Detections to file {:s}".format(len(self.detections), fname))
+        self.logger.info("Saving parameters of all {:d} Detections to file {:s}".format(len(self.detections), fname))
 
         columns = ['search_name', 'period', 'dm', 'width', 'ducy', 'snr']
-        data = []
-        for det in self.detections:
-            entry = (det.search.config['name'], det.period, det.dm, det.width, det.ducy, det.snr)
-            data.append(entry)
-
-        data = pandas.DataFrame(data, columns=columns)
-        data = sort_dataframe_by_column(data, 'period')
-        data.to_csv(fname, sep='\t', index=False, float_format='%.8f')
+        rows = (
+            (det.search.config['name'], det.period, det.dm, det.width, det.ducy, det.snr)
+            for det in sorted(self.detections, key=operator.attrgetter('period'))
+            )
+        write_table(fname, columns, rows)
 
     def save_clusters(self):
-        """ Save cluster parameters to pandas.DataFrame """
+        """ Save cluster parameters to a CSV file """
         if not self.clusters:
             return
 
         outdir = self.config['outdir']
         fname = os.path.join(outdir, self.CLUSTERS_FILE_NAME)
-        self.logger.info("Saving pandas.DataFrame with parameters of all {:d} DetectionClusters to file {:s}".format(len(self.clusters), fname))
+        self.logger.info("Saving parameters of all {:d} DetectionClusters to file {:s}".format(len(self.clusters), fname))
 
         columns = ['search_name', 'period', 'dm', 'width', 'ducy', 'snr']
-        data = []
-        for cl in self.clusters:
-            det = cl.top_detection
-            entry = (cl.search.config['name'], det.period, det.dm, det.width, det.ducy, det.snr)
-            data.append(entry)
-
-        data = pandas.DataFrame(data, columns=columns)
-        data = sort_dataframe_by_column(data, 'period')
-        data.to_csv(fname, sep='\t', index=False, float_format='%.8f')
+        rows = (
+            (cl.search.config['name'], cl.period, cl.dm, cl.top_detection.width, cl.top_detection.ducy, cl.snr)
+            for cl in sorted(self.clusters, key=operator.attrgetter('period'))
+            )
+        write_table(fname, columns, rows)
 
     def save_candidates(self):
         """ Save candidates to HDF5, and write a candidate summary file. """
@@ -538,12 +702,23 @@ class PipelineManager(object):
         summary = []
         columns = ['fname', 'period', 'dm', 'width', 'ducy', 'snr']
 
-        for index, cand in enumerate(self.candidates, start=1):
-            basename = "{:s}_{:04d}.h5".format(self.CANDIDATE_NAME_PREFIX, index)
+        basenames = [
+            "{:s}_{:04d}.h5".format(self.CANDIDATE_NAME_PREFIX, index)
+            for index in range(1, len(self.candidates) + 1)
+            ]
+
+        # Candidates are independent of each other, so they are written to
+        # their HDF5 files in parallel
+        def save_candidate(cand, basename):
             outpath = os.path.join(outdir, basename)
             self.logger.info("Saving {!s} to file {:s}".format(cand, outpath))
             cand.save_hdf5(outpath)
 
+        with ThreadPoolExecutor(max_workers=self.config['num_processes']) as executor:
+            for _ in executor.map(save_candidate, self.candidates, basenames):
+                pass
+
+        for cand, basename in zip(self.candidates, basenames):
             md = cand.metadata
             entry = (
                 basename,
@@ -557,8 +732,7 @@ class PipelineManager(object):
 
         fname = os.path.join(outdir, self.SUMMARY_FILE_NAME)
         self.logger.info("Saving candidate summary to file {:s}".format(fname))
-        summary = pandas.DataFrame(summary, columns=columns)
-        summary.to_csv(fname, sep='\t', index=False, float_format='%.8f')
+        write_table(fname, columns, summary)
 
 
     def run(self):
@@ -567,11 +741,44 @@ class PipelineManager(object):
         self.logger.info("Selecting DM trials ...")
         self.select_dm_trials()
 
-        for tsbatch in self.iter_batches():
-            dms = sorted([ts.metadata['dm'] for ts in tsbatch])
-            self.logger.info("Processing DM trials: {!s}".format(dms))
-            for search in self.searches:
-                search.process_time_series_batch(tsbatch)
+        num_processes = self.config['num_processes']
+        search_configs = [search.config for search in self.searches]
+
+        self.pool = Pool(processes=num_processes, initializer=_init_worker, initargs=(search_configs,))
+        try:
+            for tsbatch in self.iter_batches():
+                dms = sorted([ts.metadata['dm'] for ts in tsbatch])
+                self.logger.info("Processing DM trials: {!s}".format(dms))
+                self.logger.info("Searching batch of {:d} TimeSeries using {:d} worker processes ...".format(len(tsbatch), num_processes))
+                start_time = timeit.default_timer()
+
+                # Run all searches on each TimeSeries in a single worker call
+                # The data are passed through shared memory rather than pickled
+                # Each result holds one list of Detections per search, and is
+                # collected as soon as it is ready
+                shared = [share_time_series(ts) for ts in tsbatch]
+                handles = [handle for shm, handle in shared]
+                chunksize = max(1, len(handles) // (2 * num_processes))
+                new_detections = [[] for search in self.searches]
+                try:
+                    for output in self.pool.imap_unordered(_search_time_series, handles, chunksize=chunksize):
+                        for detections, dets in zip(new_detections, output):
+                            detections.append(dets)
+                finally:
+                    for shm, handle in shared:
+                        shm.close()
+                        shm.unlink()
+                for search, detections in zip(self.searches, new_detections):
+                    search.add_detections(detections)
+
+                end_time = timeit.default_timer()
+                self._cumulative_walltime += (end_time - start_time)
+                self.logger.info("Total processing time: {:.2f} seconds".format(self.cumulative_walltime()))
+        finally:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self._cumulative_walltime = 0.0
 
         self.logger.info("All DM trials have been processed. Clustering detections ...")
         for search in self.searches:
@@ -614,6 +821,10 @@ def parse_arguments():
         'outdir', type=str,
         help="Output directory for data products"
         )
+    parser.add_argument(
+        '--num_processes', type=int, default=None,
+        help="Number of worker processes. Defaults to the value in the YAML config file."
+        )
     args = parser.parse_args()
     return args
 
@@ -624,7 +835,9 @@ def main():
     # Get absolute paths right away, just to be safe
     args.config = os.path.realpath(args.config)
     args.outdir = os.path.realpath(args.outdir)
-    manager = PipelineManager(args.config, override_keys=vars(args))
+    # Options left unset on the command line keep the values in the config file
+    override_keys = {key: value for key, value in vars(args).items() if value is not None}
+    manager = PipelineManager(args.config, override_keys=override_keys)
     manager.run()
 
 
@@ -2,18 +2,27 @@
 
 ### Standard imports ###
 
-import re
 import os
 import pickle
-import logging
+import itertools
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
 
 ### Non-standard imports ###
 
-import itertools
 import numpy as np
 
 from PIL import Image
 
+# Use "pypdf" to merge PDF documents if it is installed. Otherwise,
+# fall back on "ghostscript".
+
+try:
+    from pypdf import PdfWriter
+except ImportError:
+    PdfWriter = None
+
 def unpickler(path):
 
     """ Unpickle a log file containing several pickled objects.
@@ -25,9 +34,12 @@ def unpickler(path):
         The absolute path to the log file.
     """
 
+    # The file is read through a large buffer. Each object in it is a separate
+    # pickle with its own memo, so each one is loaded by a fresh "pickle.load".
+
     try:
 
-        with open(path, 'rb') as _log_:
+        with open(path, 'rb', buffering = 1 << 20) as _log_:
             while True:
                 try:
                     _obj_ = pickle.load(_log_)
@@ -87,18 +99,16 @@ def grouper(iterable, n):
     n: int
         Number of elements to form groups of.
     """
-    
-    # we want izip_longest() in python 2.x
-    # or zip_longest() in python 3.x
 
-    if hasattr(itertools, 'zip_longest'):
-        zipper = itertools.zip_longest
-    else:
-        zipper = itertools.izip_longest
-    args = [iter(iterable)] * n
-    for group in zipper(*args, fillvalue=None):
-        filtered_group = [val for val in group if val is not None]
-        yield filtered_group
+    # Slice groups straight off a single iterator, so no padding
+    # ever has to be filtered out of them.
+
+    iterator = iter(iterable)
+    while True:
+        group = list(itertools.islice(iterator, n))
+        if not group:
+            return
+        yield group
 
 def step_iter(sequence, vmin, vmax, step):
 
@@ -120,22 +130,27 @@ def step_iter(sequence, vmin, vmax, step):
 
     # Ignore steps outside of bounds
 
-    array = np.asarray(sorted(list(sequence)))
+    array = np.sort(np.fromiter(sequence, dtype = np.float64))
     mask = (array >= vmin) & (array <= vmax)
     array = array[mask]
     
-    # Yield values separated by at least 'step'
+    # Yield values separated by at least 'step'. Each value is found from the
+    # last one with a binary search, instead of stepping through every value.
 
-    last = None
     rtol = 1e-7 # Deal with float rounding errors
-    for value in array:
-        if last is None or value - last >= step * (1-rtol):
-            last = value
-            yield value
+    selected = []
+    index = 0
+    while index < len(array):
+        selected.append(index)
+        next_index = np.searchsorted(array, array[index] + step * (1-rtol), side = 'left')
+        index = max(index + 1, next_index)
+
+    yield from array[selected]
 
-def filter_by_ext(folder, **kwargs):
+def filter_by_ext(folder, *, extension):
 
-    """ Generator that filters out files by extension using the "FileWalker" function.
+    """ Generator that filters out files by extension, testing the name of
+    each entry returned by "os.scandir" directly.
 
     Arguments:
     -----------
@@ -148,13 +163,15 @@ def filter_by_ext(folder, **kwargs):
         The extension to filter the files with.
     """
 
-    predicate = [lambda x, y: os.path.join(x,y).endswith(kwargs['extension'])]
-    return file_walker(folder, predicate)
+    with os.scandir(folder) as files:
+        for f in files:
+            if f.name.endswith(extension):
+                yield f
 
 def count_files(folder, **kwargs):
 
-    """ Function that counts the number of files, filtered by extension 
-    using the "filter_by_ext" function.
+    """ Function that counts the number of files, filtered by extension,
+    in a single pass over "os.scandir".
 
     Arguments:
     -----------
@@ -167,8 +184,10 @@ def count_files(folder, **kwargs):
         The extension to filter the files with.
     """
 
-    files = filter_by_ext(folder, extension = kwargs['extension'])
-    count = len([1 for x in list(files) if x.is_file()])
+    extension = kwargs['extension']
+    with os.scandir(folder) as entries:
+        count = sum(1 for entry in entries
+                    if entry.name.endswith(extension) and entry.is_file())
     return count
 
 def list_files(startpath):
@@ -182,18 +201,57 @@ def list_files(startpath):
         The starting path of the directoryr tree.
     """
 
-    for root, dirs, files in os.walk(startpath):
-        level = root.replace(startpath, '').count(os.sep)
+    def _walk_(path, level):
+
+        # Each directory is scanned once with "os.scandir", whose entries
+        # already know whether they are directories or not. Files are
+        # printed before descending into subdirectories, as "os.walk" did.
+
         indent = ' ' * 4 * (level)
-        print('{}{}/'.format(indent, os.path.basename(root)))
+        print('{}{}/'.format(indent, os.path.basename(path)))
         subindent = ' ' * 4 * (level + 1)
-        for f in files:
-            print('{}{}'.format(subindent, f))    
 
-def make_pdf(img_dir, save_to_pdf):
+        with os.scandir(path) as entries:
+            entries = sorted(entries, key = lambda entry: entry.name)
+
+        # Like "os.walk", symbolic links to directories are not followed.
+
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    subdirs.append(entry.path)
+            else:
+                print('{}{}'.format(subindent, entry.name))
+
+        for subdir in subdirs:
+            _walk_(subdir, level + 1)
+
+    _walk_(startpath, 0)
+
+def load_image(img_path):
+
+    """ Load a PNG image fully into memory, converting it to RGB if it has an
+    alpha channel (which cannot be saved to PDF). Used by a pool of threads
+    in "make_pdf", since Pillow releases the GIL while decoding.
+
+    Arguments:
+    ----------
+    img_path: str or Path-like
+        The absolute path to the image.
+    """
+
+    IMG = Image.open(img_path)
+    IMG.load()
+    if IMG.mode == 'RGBA':
+        IMG = IMG.convert('RGB')
+    return IMG
+
+def make_pdf(img_dir, save_to_pdf, max_workers=1):
 
     """ Make a single, multi-page PDF document out of a directory of PNG
-    images.
+    images. Pages are ordered by file name. Images are decoded and added to
+    the document a few at a time, so that only those are held in memory.
 
     Arguments:
     ----------
@@ -201,16 +259,79 @@ def make_pdf(img_dir, save_to_pdf):
         The directory that contains the images.
     save_to_pdf: str or Path-like
         The absolute path to the PDF document.
+
+    Keyword Arguments:
+    ------------------
+    max_workers: int
+        Number of threads used to decode the images.
+    """
+
+    img_files = sorted(img_file.path for img_file in filter_by_ext(img_dir, extension = '.png'))
+
+    # Threads, rather than processes, so that decoded images do not have to
+    # be pickled back from the workers.
+
+    pool = ThreadPoolExecutor(max_workers = max_workers) if max_workers > 1 else None
+
+    try:
+        append = False
+        for group in grouper(img_files, 2 * max_workers):
+            if pool is not None:
+                images = list(pool.map(load_image, group))
+            else:
+                images = [load_image(img_file) for img_file in group]
+
+            # The first group creates the document, the rest are appended to it.
+
+            images[0].save(save_to_pdf, save_all = True, append = append, quality=100, append_images = images[1:])
+            append = True
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def ps_to_pdf(ps_path):
+
+    """ Convert a PostScript document to PDF using the "ps2pdf" script from
+    "ghostscript". The PDF is saved next to the PostScript document, and its
+    path is returned. Defined at the top level of the module so that it can
+    be mapped over by a process pool.
+
+    Arguments:
+    ----------
+    ps_path: str or Path-like
+        The absolute path to the PostScript document.
     """
 
-    img_files = filter_by_ext(img_dir, extension = '.png')
-    images = []
+    pdf_path = os.path.splitext(ps_path)[0] + '.pdf'
+    subprocess.run(['ps2pdf', ps_path, pdf_path],
+                   stdout = subprocess.DEVNULL,
+                   stderr = subprocess.DEVNULL,
+                   check = True)
+    return pdf_path
 
-    for img_file in img_files:
+def merge_pdfs(pdf_paths, save_to_pdf):
 
-        IMG = Image.open(img_file.path)
-        if IMG.mode == 'RGBA':
-            IMG = IMG.convert('RGB')
-        images.append(IMG)
+    """ Merge several PDF documents into a single PDF document, in the order
+    given. Pages are copied as they are if "pypdf" is installed, otherwise the
+    documents are merged by "ghostscript".
 
-    images[0].save(save_to_pdf, save_all = True, quality=100, append_images = images[1:])
+    Arguments:
+    ----------
+    pdf_paths: list
+        The absolute paths to the PDF documents.
+    save_to_pdf: str or Path-like
+        The absolute path to the merged PDF document.
+    """
+
+    if PdfWriter is not None:
+        writer = PdfWriter()
+        for pdf_path in pdf_paths:
+            writer.append(pdf_path)
+        with open(save_to_pdf, 'wb') as _pdf_:
+            writer.write(_pdf_)
+    else:
+        subprocess.run(['gs', '-sDEVICE=pdfwrite', '-dNOPAUSE', '-dBATCH', '-dSAFER',
+                        '-sOutputFile={}'.format(save_to_pdf)] + list(pdf_paths),
+                       stdout = subprocess.DEVNULL,
+                       stderr = subprocess.DEVNULL,
+                       check = True)
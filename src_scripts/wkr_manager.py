@@ -6,16 +6,19 @@ import os
 import timeit
 import pickle
 import logging
+import multiprocessing
 
 from datetime import timedelta
+from concurrent.futures import as_completed
 from concurrent.futures import ProcessPoolExecutor as Pool
 
 ### Local imports ###
 
 from .utilities import unpickler, grouper, filter_by_ext
-from .filterbank_no_rfifind import Filterbank
 
-# from .filterbank import Filterbank
+# "Filterbank" is imported when a date is processed, not here, since it pulls
+# in heavy dependencies (NumPy, astropy, riptide, ...) that the process that
+# only manages the pool never needs.
 
 
 class PipelineWorker(object):
@@ -59,30 +62,25 @@ class PipelineWorker(object):
             The absolute path to the directory where the data files are supposed to be.
         """
 
-        RAW_FILES = filter_by_ext(path, extension=".raw")
+        # Scan the directory only once. Stop as soon as a "*.raw" file is found,
+        # but remember if any "*.fil" files were seen along the way.
 
-        try:
+        has_fil = False
 
-            RAW_FILES.__next__()
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name.endswith(".raw"):
+                    EXT = ".raw"
+                    return EXT
+                if entry.name.endswith(".fil"):
+                    has_fil = True
 
-        except StopIteration:
-
-            try:
-                FIL_FILES = filter_by_ext(path, extension=".fil")
-                FIL_FILES.__next__()
-
-            except StopIteration:
-                return None
-
-            else:
-                EXT = ".fil"
-                return EXT
-
-        else:
-
-            EXT = ".raw"
+        if has_fil:
+            EXT = ".fil"
             return EXT
 
+        return None
+
     def make_dirs(self, beam_rfi_path, beam_state_path):
 
         """Make the appropriate directories.
@@ -137,6 +135,10 @@ class PipelineWorker(object):
             The date for which data is to be processed.
         """
 
+        from .filterbank_no_rfifind import Filterbank
+
+        # from .filterbank import Filterbank
+
         #####################################################################################
 
         self.date = date
@@ -176,7 +178,14 @@ class PipelineWorker(object):
             # Unpickle list of Meta objects and get the filenames from them.
 
             metalist = "./{}.history.log".format(self.date)
-            _metalist_ = unpickler(metalist)
+
+            # A missing or empty log means the pipeline has not run before, which
+            # can be told from the size of the file without unpickling anything.
+
+            if os.path.isfile(metalist) and os.path.getsize(metalist) > 0:
+                _metalist_ = unpickler(metalist)
+            else:
+                _metalist_ = iter(())
 
             # Decide which mode to open the hidden log file in based on whether it already exists
             # or not and filter the list of files accordingly and iterate through them to process
@@ -188,20 +197,22 @@ class PipelineWorker(object):
 
                 # The pipeline has run before. Restore previous state.
 
-                _filelist_ = [meta["fname"] for meta in _metalist_]
+                _filelist_ = {meta["fname"] for meta in _metalist_}
                 FILES = [f for f in _files_ if f.name not in _filelist_]
 
             except StopIteration:
 
-                # Running from scratch. Initialise the list of files.
+                # Running from scratch. Process every file. The directory scan is
+                # snapshotted into a list, so that it is not held open while the
+                # processing (which writes into the directory) runs.
 
-                FILES = [_file_ for _file_ in _files_]
+                FILES = list(_files_)
 
                 # Before processing starts, pickle the current pipeline configuration into
                 # the hidden log file, before it is too late.
 
                 with open(metalist, "wb+") as _mem_:
-                    pickle.dump(self.config, _mem_)
+                    pickle.dump(self.config, _mem_, protocol=pickle.HIGHEST_PROTOCOL)
 
             #####################################################################################
 
@@ -211,9 +222,22 @@ class PipelineWorker(object):
 
             #####################################################################################
 
-            for FILE in FILES:
+            # Both logs are opened once for the whole date. They are flushed after
+            # every file, so that the pipeline can still be resumed from (and the
+            # monitor can still see) every file processed so far.
+
+            with open(metalist, "ab") as _mem_, open(filelist, "a") as _list_:
+
+                _pickler_ = pickle.Pickler(_mem_, protocol=pickle.HIGHEST_PROTOCOL)
 
-                with open(metalist, "ab") as _mem_, open(filelist, "a") as _list_:
+                # Things that do not change from one file to the next.
+
+                from_raw = EXT == ".raw"
+                _dump_ = _pickler_.dump
+                _clear_memo_ = _pickler_.clear_memo
+                _write_ = _list_.write
+
+                for FILE in FILES:
 
                     # Initialise the filterbank file and process it.
 
@@ -234,14 +258,22 @@ class PipelineWorker(object):
                     # just processed into a hidden log file and store the name of
                     # the file in a human readable filelist.
 
-                    pickle.dump(filterbank.metadata, _mem_)
-                    _list_.write("{}\n".format(FIL_NAME))
+                    # The memo is cleared after every dump, so that every entry in the
+                    # log can still be unpickled on its own.
+
+                    _dump_(filterbank.metadata)
+                    _clear_memo_()
+                    _write_(FIL_NAME + "\n")
+
+                    _mem_.flush()
+                    _list_.flush()
 
                     # Delete the filterbank file if we started with a "*.raw" file.
                     # Otherwise leave it be.
 
-                    if (EXT == ".raw") and (filterbank.path.endswith(".fil")):
-                        os.remove(filterbank.path)
+                    FIL_PATH = filterbank.path
+                    if from_raw and FIL_PATH.endswith(".fil"):
+                        os.remove(FIL_PATH)
 
             #####################################################################################
 
@@ -251,6 +283,32 @@ class PipelineWorker(object):
         self.logger.info("Total processing time: {}".format(self.cumulative_walltime()))
 
 
+# The PipelineWorker of each process in the pool used by PipelineManager.
+# Built once per process by "_init_worker", so that the configuration is
+# handed to each process once instead of being pickled along with each date.
+
+_worker_ = None
+
+
+def _init_worker(config, cores):
+
+    """Initialise the PipelineWorker of a process in the pool. The worker only
+    gets its share ("cores") of the cores of the node, since all the pools run
+    while processing a date are sized by it.
+    """
+
+    global _worker_
+    config.cores = cores
+    _worker_ = PipelineWorker(config)
+
+
+def _process_date(date):
+
+    """ Process a single date using the PipelineWorker of this process. """
+
+    return _worker_(date)
+
+
 class PipelineManager(object):
 
     """ Class that handles the parallelisation of the pipeline across multiple dates. """
@@ -268,18 +326,52 @@ class PipelineManager(object):
         self.config = config
         self.make_dirs(self.config.rfi_path, self.config.state_path)
 
-        self.Worker = PipelineWorker(config)
-
     def make_dirs(self, rfi_path, state_path):
 
         os.makedirs(rfi_path, exist_ok=True)
         os.makedirs(state_path, exist_ok=True)
 
-    def process(self):
+    def process(self, dates=None):
 
         """Processes several dates in parallel using the "concurrent.futures"
-        module's "ProcessPoolExecutor".
+        module's "ProcessPoolExecutor". The pool is sized by the number of
+        cores per node, and dates are handed out one at a time, and collected
+        as they finish, so that long dates do not hold up short ones. The cores
+        are shared equally between the dates being processed at once, so that
+        the pools each date runs do not oversubscribe the node.
+
+        Parameters:
+        -----------
+        dates: list, optional
+            The dates to be processed. Defaults to all the dates
+            to be analysed, as set in the configuration file.
         """
 
-        with Pool() as pool:
-            [p for p in pool.map(self.Worker, self.config.analysis_dates)]
+        if dates is None:
+            dates = self.config.analysis_dates
+
+        num_workers = max(1, min(self.config.cores, len(dates)))
+        cores_per_date = max(1, self.config.cores // num_workers)
+
+        # Start workers from a clean server process where possible, instead of
+        # forking this one, so that each starts small and imports only what it
+        # needs.
+
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            mp_context = multiprocessing.get_context("forkserver")
+        else:
+            mp_context = None
+
+        with Pool(
+            max_workers=num_workers,
+            mp_context=mp_context,
+            initializer=_init_worker,
+            initargs=(self.config, cores_per_date),
+        ) as pool:
+            processes = [pool.submit(_process_date, date) for date in dates]
+
+            # Collect dates as they finish, in whatever order that is, so that
+            # a failed date is reported without waiting on the ones before it.
+
+            for process in as_completed(processes):
+                process.result()
@@ -43,14 +43,7 @@ if __name__ == '__main__':
                         help = textwrap.dedent(
                         """ The date for which updates are required. """))
 
-    try:
-
-        args = parser.parse_args()
-
-    except:
-
-        parser.print_help()
-        parser.exit(1)
+    args = parser.parse_args()
 
     date = args.date
 
@@ -222,16 +215,17 @@ if __name__ == '__main__':
 
                 updates = reader('./{}.PIDS.log'.format(date))
 
-                # Print updates to screen.
+                # Print all updates to screen at once, with a single refresh.
 
-                try:
-                    for line in updates:
-                        update_text_window.addstr(line)
-                        update_text_window.refresh()
+                text = ''.join(updates)
+
+                if text:
+                    update_text_window.addstr(text)
+                    update_text_window.refresh()
                 
                 # If there are no updates to print, inform the user that there is a problem.
 
-                except StopIteration:
+                else:
 
                     update_text_window.addstr('Houston, we may have a problem.')
                     update_text_window.refresh()
@@ -266,11 +260,10 @@ if __name__ == '__main__':
  
                     record = build_record(config, summary)
 
-                    # Print the summary on the screen.
+                    # Print the summary on the screen. It is refreshed
+                    # once it has been written in full, below.
 
-                    for line in record:
-                        update_text_window.addstr(line)
-                        update_text_window.refresh()
+                    update_text_window.addstr(''.join(record))
                    
                     # Path where summary must be saved.
 